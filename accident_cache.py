@@ -0,0 +1,250 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from accident_decoder import concat_frames
+from data_source import AccidentDataSource, create_data_source, YEARS
+from query_engine import AccidentIndex
+import spatial_index
+from spatial_index import SpatialIndex
+from temporal_cube import TemporalCube
+
+_MAX_BYTES = int(os.getenv("ACCIDENT_CACHE_MB", "512")) * 1024 * 1024
+_MAX_BOXES = 8
+_VERSION_CHECK_INTERVAL = float(os.getenv("ACCIDENT_CACHE_VERSION_INTERVAL", "60"))
+
+
+class AccidentCache():
+    # Process wide cache of decoded per-year accident frames with LRU eviction under a memory budget.
+    # The whole cache is dropped as soon as the data version published by the loader tools changes.
+    # Without a source the configured one is created on first use, so importing the app never connects anywhere.
+    def __init__(self, source: AccidentDataSource = None, max_bytes=_MAX_BYTES,
+                 version_check_interval=_VERSION_CHECK_INTERVAL):
+        self._source = source
+        self._source_lock = threading.Lock()
+        self.max_bytes = max_bytes
+        self.version_check_interval = version_check_interval
+        self._frames = OrderedDict()
+        # bytes of every cached year, its frame and the indexes built over it
+        self._sizes = {}
+        self._frame_sizes = {}
+        # filter and spatial indexes of the cached frames, evicted together with their frame
+        self._indexes = {}
+        self._spatial = {}
+        # hotspot rankings over several years, a single year is ranked when its spatial index is built
+        self._hotspots = {}
+        self._counts = None
+        self._cube = None
+        # the last few viewport results, so a recolour of the same view gets exactly the same rows
+        self._boxes = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = None
+        # incremented by every invalidation, loads that started before one are not cached
+        self._generation = 0
+
+    @property
+    def source(self) -> AccidentDataSource:
+        if self._source is None:
+            with self._source_lock:
+                if self._source is None:
+                    self._source = create_data_source()
+        return self._source
+
+    @property
+    def size_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            self._frames.clear()
+            self._sizes.clear()
+            self._frame_sizes.clear()
+            self._indexes.clear()
+            self._spatial.clear()
+            self._hotspots.clear()
+            self._counts = None
+            self._cube = None
+            self._boxes.clear()
+
+    def _check_version(self):
+        now = time.monotonic()
+        if self._version_checked is not None and now - self._version_checked < self.version_check_interval:
+            return
+        version = self.source.get_version()
+        self._version_checked = now
+        if version != self._version:
+            if self._version is not None:
+                print(f"Data version changed to {version}, dropping cached accident frames")
+            self.invalidate()
+            self._version = version
+
+    def current_version(self):
+        self._check_version()
+        return self._version
+
+    def _evict(self):
+        while self._frames and self.size_bytes > self.max_bytes:
+            year, _ = self._frames.popitem(last=False)
+            self._sizes.pop(year)
+            self._frame_sizes.pop(year)
+            self._indexes.pop(year, None)
+            self._spatial.pop(year, None)
+            print(f"Evicted year {year} from accident cache")
+
+    def get_year(self, year) -> pd.DataFrame:
+        year = str(year)
+        self._check_version()
+        with self._lock:
+            if year in self._frames:
+                self._frames.move_to_end(year)
+                return self._frames[year]
+            generation = self._generation
+
+        # load outside the lock so a slow year does not block lookups of cached ones
+        frame = self.source.load_year(year)
+        with self._lock:
+            stale = generation != self._generation
+            if not stale:
+                self._frames[year] = frame
+                self._frame_sizes[year] = int(frame.memory_usage(deep=True).sum())
+                self._sizes[year] = self._frame_sizes[year]
+                self._evict()
+        if stale:
+            # the data version changed during the load, the frame may belong to the old one
+            return self.get_year(year)
+        return frame
+
+    def _account(self, year):
+        # the indexes count toward the memory budget, their arrays are several times the size of the frame
+        with self._lock:
+            if year not in self._frames:
+                return
+            indexes = [self._indexes.get(year), self._spatial.get(year)]
+            self._sizes[year] = self._frame_sizes[year] + sum(index.nbytes for index in indexes if index is not None)
+            self._evict()
+
+    def get_frame(self, year) -> pd.DataFrame:
+        if year == "all":
+            return concat_frames(self.get_year(y) for y in YEARS)
+        return self.get_year(year)
+
+    def get_index(self, year) -> AccidentIndex:
+        year = str(year)
+        frame = self.get_year(year)
+        with self._lock:
+            index = self._indexes.get(year)
+            if index is None or index.df is not frame:
+                index = AccidentIndex(frame, on_build=lambda: self._account(year))
+                self._indexes[year] = index
+        return index
+
+    def get_spatial_index(self, year) -> SpatialIndex:
+        year = str(year)
+        frame = self.get_year(year)
+        with self._lock:
+            index = self._spatial.get(year)
+            if index is not None and index.df is frame:
+                return index
+        # sorting the points takes a moment, it does not hold up lookups of other years
+        index = SpatialIndex(frame)
+        with self._lock:
+            # not kept for a frame that was evicted or invalidated in the meantime
+            if self._frames.get(year) is frame:
+                self._spatial[year] = index
+        self._account(year)
+        return index
+
+    def get_hotspots(self, years, severity=None) -> list:
+        self._check_version()
+        key = (tuple(str(y) for y in years), severity)
+        with self._lock:
+            if key in self._hotspots:
+                return self._hotspots[key]
+            generation = self._generation
+        hotspots = spatial_index.hotspots([self.get_spatial_index(y) for y in years], severity)
+        with self._lock:
+            stale = generation != self._generation
+            if not stale:
+                self._hotspots[key] = hotspots
+        # like get_year, a result computed across an invalidation is computed again
+        return self.get_hotspots(years, severity) if stale else hotspots
+
+    def get_counts(self, year):
+        # precomputed chart counts for a year (or "all"), None if the stats pipeline has not produced them
+        self._check_version()
+        counts = self._counts
+        if counts is None:
+            generation = self._generation
+            counts = self.source.load_counts()
+            with self._lock:
+                stale = generation != self._generation
+                if not stale:
+                    self._counts = counts
+            if stale:
+                return self.get_counts(year)
+        if not counts:
+            return None
+        return counts.get(str(year))
+
+    def get_cube(self) -> TemporalCube:
+        # temporal roll-ups of the animation page, None if the data tools have not built the cube
+        self._check_version()
+        cube = self._cube
+        if cube is None:
+            generation = self._generation
+            cube = self.source.load_cube()
+            with self._lock:
+                stale = generation != self._generation
+                if not stale:
+                    self._cube = cube
+            if stale:
+                return self.get_cube()
+        return cube
+
+    def get_box(self, year, bounds, limit) -> pd.DataFrame:
+        # viewport queries go to the backend if it can filter by itself, otherwise the cached frames are filtered
+        if self.source.native_box_query:
+            key = (str(year), tuple(bounds), limit)
+            with self._lock:
+                if key in self._boxes:
+                    self._boxes.move_to_end(key)
+                    return self._boxes[key]
+                generation = self._generation
+            frame = self.source.load_box(year, bounds, limit)
+            with self._lock:
+                stale = generation != self._generation
+                if not stale:
+                    self._boxes[key] = frame
+                    while len(self._boxes) > _MAX_BOXES:
+                        self._boxes.popitem(last=False)
+            return self.get_box(year, bounds, limit) if stale else frame
+        west, south, east, north = bounds
+        df = self.get_frame(year)
+        inside = df['lon'].between(west, east) & df['lat'].between(south, north)
+        return df[inside].head(limit)
+
+    def get_stats(self, stat):
+        return self.source.get_stats(stat)
+
+    def prewarm(self, years=YEARS):
+        # loads the frames and counts of the map page ahead of the first requests, as far as the budget allows
+        init = time.time()
+        self.get_counts("all")
+        for year in years:
+            self.get_year(year)
+        print(f"Prewarmed accident cache with {len(self._frames)} years in {time.time() - init:.2f} seconds")
+
+
+cache = AccidentCache()
+
+
+def use_source(source: AccidentDataSource):
+    # swaps the process wide cache, e.g. for benchmarks against an in-memory dataset
+    global cache
+    cache = AccidentCache(source)
+    return cache
@@ -0,0 +1,72 @@
+import itertools
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from mongo_data_layer import ACCIDENT_FIELDS
+
+FLOAT_COLUMNS = ["lat", "lon"]
+BOOL_COLUMNS = ["AccidentInvolvingBicycle", "AccidentInvolvingPedestrian"]
+COLUMNS = list(ACCIDENT_FIELDS)
+
+# documents decoded together, only one chunk of raw documents is held next to the typed frames
+CHUNK_SIZE = 50000
+
+
+def _flat(doc, columns) -> dict:
+    # flat rows from a $project have the columns at the top level, raw GeoJSON features nest them
+    properties = doc.get("properties")
+    if properties is None:
+        return doc
+    coordinates = (doc.get("geometry") or {}).get("coordinates") or (None, None)
+    row = {c: properties.get(c) for c in columns}
+    row["lon"], row["lat"] = coordinates[0], coordinates[1]
+    return row
+
+
+def iter_decoded_chunks(docs, columns=COLUMNS, chunk_size=CHUNK_SIZE):
+    docs = iter(docs)
+    while True:
+        chunk = [_flat(doc, columns) for doc in itertools.islice(docs, chunk_size)]
+        if not chunk:
+            return
+        yield decode_frame(pd.DataFrame.from_records(chunk, columns=columns))
+
+
+def decode_documents(docs, columns=COLUMNS) -> pd.DataFrame:
+    # Decodes a cursor of projected rows or raw features into a typed frame while it is fetched:
+    # float32 coordinates, boolean involvement flags and categorical labels.
+    frames = list(iter_decoded_chunks(docs, columns))
+    if not frames:
+        return decode_frame(pd.DataFrame.from_records([], columns=columns))
+    return frames[0] if len(frames) == 1 else concat_frames(frames)
+
+
+def decode_frame(df) -> pd.DataFrame:
+    # same types for a frame that was built from plain strings, e.g. from GeoJSON properties
+    data = {}
+    for c in df.columns:
+        if c in FLOAT_COLUMNS:
+            data[c] = df[c].astype(np.float32)
+        elif c in BOOL_COLUMNS:
+            data[c] = df[c].isin([True, "true"])
+        elif isinstance(df[c].dtype, pd.CategoricalDtype):
+            data[c] = df[c]
+        else:
+            data[c] = df[c].astype("category")
+    return pd.DataFrame(data, index=df.index)
+
+
+def concat_frames(frames) -> pd.DataFrame:
+    # plain pd.concat falls back to object columns when the categories of the frames differ
+    frames = list(frames)
+    if not frames:
+        return pd.DataFrame(columns=COLUMNS)
+    data = {}
+    for c in frames[0].columns:
+        if all(isinstance(df[c].dtype, pd.CategoricalDtype) for df in frames):
+            data[c] = union_categoricals([df[c] for df in frames])
+        else:
+            data[c] = np.concatenate([df[c].to_numpy() for df in frames])
+    return pd.DataFrame(data)
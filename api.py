@@ -0,0 +1,99 @@
+from fastapi import APIRouter, HTTPException, Query
+
+import accident_cache
+import spatial_index
+from async_data_layer import run_limited, map_route
+from data_source import YEARS
+
+# mounted under /api by main.py
+router = APIRouter()
+
+# upper bounds of the spatial query parameters, larger values are rejected with a 422
+MAX_RADIUS = 50000
+MAX_ACCIDENTS = 10000
+MAX_NEAREST = 1000
+
+MAP_COLUMNS = ["lat", "lon", "AccidentType_de", "AccidentSeverityCategory_de", "AccidentInvolvingBicycle"]
+
+
+def accident_columns(year) -> dict:
+    df = accident_cache.cache.get_frame(year)
+    return {column: df[column].tolist() for column in MAP_COLUMNS}
+
+
+def check_year(year):
+    if year != "all" and year not in YEARS:
+        raise HTTPException(status_code=404, detail=f"No accidents for year {year}")
+
+
+def spatial_years(year) -> list:
+    check_year(year)
+    return YEARS if year == "all" else [year]
+
+
+def spatial_indexes(year) -> list:
+    return [accident_cache.cache.get_spatial_index(y) for y in spatial_years(year)]
+
+
+def nearby_columns(df) -> dict:
+    return {"count": len(df), "accidents": {column: df[column].tolist() for column in MAP_COLUMNS + ["distance_m"]}}
+
+
+def accidents_within(year, lat, lon, radius, limit) -> dict:
+    return nearby_columns(spatial_index.within(spatial_indexes(year), lon, lat, radius, limit))
+
+
+def accidents_nearest(year, lat, lon, k) -> dict:
+    return nearby_columns(spatial_index.nearest(spatial_indexes(year), lon, lat, k))
+
+
+def year_hotspots(year, severity, limit) -> list:
+    return accident_cache.cache.get_hotspots(spatial_years(year), severity)[:limit]
+
+
+def stats_document(stat):
+    doc = accident_cache.cache.get_stats(stat)
+    if doc is None:
+        return None
+    return {k: v for k, v in doc.items() if k != "_id"}
+
+
+@router.get("/accidents/{year}")
+async def accidents(year: str):
+    # unknown years are rejected before they take a slot of the route limit
+    check_year(year)
+    return await run_limited(map_route(year), accident_columns, year)
+
+
+@router.get("/counts/{year}")
+async def counts(year: str):
+    stats = await run_limited("charts", accident_cache.cache.get_counts, year)
+    if stats is None:
+        raise HTTPException(status_code=404, detail=f"No counts for year {year}")
+    return stats
+
+
+@router.get("/stats/{stat}")
+async def stats(stat: str):
+    doc = await run_limited("anim", stats_document, stat)
+    if doc is None:
+        raise HTTPException(status_code=404, detail=f"No stats document {stat}")
+    return doc
+
+
+@router.get("/within/{year}")
+async def within(year: str, lat: float, lon: float, radius: float = Query(500, ge=0, le=MAX_RADIUS),
+                 limit: int = Query(1000, ge=1, le=MAX_ACCIDENTS)):
+    # accidents within radius metres of a point, nearest first
+    return await run_limited("spatial", accidents_within, year, lat, lon, radius, limit)
+
+
+@router.get("/nearest/{year}")
+async def nearest(year: str, lat: float, lon: float, k: int = Query(10, ge=1, le=MAX_NEAREST)):
+    return await run_limited("spatial", accidents_nearest, year, lat, lon, k)
+
+
+@router.get("/hotspots/{year}")
+async def hotspots(year: str, severity: str = None, limit: int = Query(spatial_index.HOTSPOTS, ge=1)):
+    # densest accident clusters of a year (or all years), optionally of one severity
+    return await run_limited("spatial", year_hotspots, year, severity, limit)
@@ -0,0 +1,91 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+
+# Maximum number of concurrent data requests per route. Every route has its own worker threads, so one slow
+# "all years" request can only occupy the "map-all" workers and never delays single year requests.
+ROUTE_LIMITS = {
+    "map-year": 4,
+    "map-all": 1,
+    "map-range": 2,
+    "map-box": 4,
+    "charts": 4,
+    "anim": 2,
+    "tiles": 4,
+    "spatial": 4,
+}
+QUEUE_TIMEOUT = float(os.getenv("DATA_QUEUE_TIMEOUT", "120"))
+# requests of a route waiting for a worker, further ones are rejected instead of piling up behind them
+QUEUE_SIZE = int(os.getenv("DATA_QUEUE_SIZE", "16"))
+
+_executors = {}
+_slots = {}
+_executors_lock = threading.Lock()
+
+
+class Overloaded(Exception):
+    pass
+
+
+def route_limit(route) -> int:
+    return int(os.getenv(f"CONCURRENCY_{route.upper().replace('-', '_')}", ROUTE_LIMITS[route]))
+
+
+def get_executor(route) -> ThreadPoolExecutor:
+    with _executors_lock:
+        executor = _executors.get(route)
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=route_limit(route), thread_name_prefix=f"data-{route}")
+            _executors[route] = executor
+            _slots[route] = threading.BoundedSemaphore(route_limit(route) + QUEUE_SIZE)
+    return executor
+
+
+def submit(route, fn, *args) -> Future:
+    executor = get_executor(route)
+    slots = _slots[route]
+    if not slots.acquire(blocking=False):
+        raise Overloaded(f"Too many queued {route} requests")
+    try:
+        future = executor.submit(fn, *args)
+    except BaseException:
+        slots.release()
+        raise
+    # also released when a queued request is cancelled
+    future.add_done_callback(lambda _: slots.release())
+    return future
+
+
+def map_route(year, bounds=None) -> str:
+    if bounds is not None:
+        return "map-box"
+    # "all" spans every year frame, ranges of a few years get their own workers so they do not queue behind it
+    if str(year).isdigit():
+        return "map-year"
+    return "map-all" if year == "all" else "map-range"
+
+
+async def run_limited(route, fn, *args):
+    # for the async FastAPI endpoints, the event loop is never blocked by pandas or pymongo work
+    # a cancelled request (e.g. the client went away) is removed from the queue if it has not started yet
+    return await asyncio.wrap_future(submit(route, fn, *args))
+
+
+def call_limited(route, fn, *args):
+    # for the Dash callbacks running on the WSGI bridge threads, they wait for a free worker of their route
+    future = submit(route, fn, *args)
+    try:
+        return future.result(timeout=QUEUE_TIMEOUT)
+    except TimeoutError:
+        # abandoned work that has not started would only delay the next requests of the route
+        future.cancel()
+        raise
+
+
+def shutdown():
+    with _executors_lock:
+        for executor in _executors.values():
+            executor.shutdown(wait=False, cancel_futures=True)
+        _executors.clear()
+        _slots.clear()
@@ -0,0 +1,237 @@
+# Reproducible benchmarks of the data-to-figure pipeline against a synthetic in-memory dataset.
+#
+#   python -m benchmarks.run_benchmarks --output benchmarks/baseline.json
+#   python -m benchmarks.run_benchmarks --compare benchmarks/baseline.json
+#
+# Every scenario runs in a fresh process, so the reported peak RSS belongs to that scenario alone.
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import statistics
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+YEARS = [str(x) for x in range(2011, 2024)]
+ACCIDENTS_PER_YEAR = 20000
+SEED = 42
+
+TYPES = ["Schleuder- oder Selbstunfall", "Auffahrunfall", "Abbiegeunfall", "Einbiegeunfall", "Überqueren der Fahrbahn",
+         "Frontalkollision", "Parkierunfall", "Fussgängerunfall", "Tierunfall", "Überholunfall oder Fahrstreifenwechsel",
+         "andere"]
+SEVERITIES = ["Unfall mit Leichtverletzten", "Unfall mit Schwerverletzten", "Unfall mit Getöteten"]
+ROADS = ["Hauptstrasse", "Nebenstrasse", "Autobahn", "Autostrasse", "Nebenanlage", "andere"]
+CANTONS = ["ZH", "BE", "LU", "UR", "SZ", "OW", "NW", "GL", "ZG", "FR", "SO", "BS", "BL", "SH", "AR", "AI", "SG", "GR",
+           "AG", "TG", "TI", "VD", "VS", "NE", "GE", "JU"]
+
+# name: (years shown on the page, multiplier of the accidents per year)
+SCALES = {
+    "1y": (["2023"], 1),
+    "all": (YEARS, 1),
+    "allx10": (YEARS, 10),
+}
+SCENARIOS = ["map_bins", "map_points", "map_tiles", "charts", "crossfilter", "spatial", "anim", "temporal",
+             "stats_build"]
+
+
+def synthetic_year(year, n, rng) -> pd.DataFrame:
+    # typed like the frames the app decodes from MongoDB or the snapshot
+    from accident_decoder import decode_frame
+
+    return decode_frame(pd.DataFrame({
+        "lat": rng.uniform(45.8, 47.8, n),
+        "lon": rng.uniform(5.9, 10.5, n),
+        "AccidentType_de": rng.choice(TYPES, n),
+        "AccidentSeverityCategory_de": rng.choice(SEVERITIES, n, p=[0.8, 0.18, 0.02]),
+        "AccidentInvolvingBicycle": rng.choice(["true", "false"], n, p=[0.15, 0.85]),
+        "AccidentInvolvingPedestrian": rng.choice(["true", "false"], n, p=[0.1, 0.9]),
+        "RoadType_de": rng.choice(ROADS, n),
+        "CantonCode": rng.choice(CANTONS, n),
+        "AccidentYear": year,
+    }))
+
+
+def synthetic_cube(frames, rng):
+    # random accident times for the synthetic frames, only their counts are kept in the cube
+    from temporal_cube import TemporalCube, FIXED_LABELS, group_cube_rows
+
+    rows = []
+    for year, df in frames.items():
+        n = len(df)
+        rows.append(group_cube_rows(pd.DataFrame({
+            "AccidentYear": year,
+            "AccidentMonth": rng.choice(FIXED_LABELS["AccidentMonth"], n),
+            "AccidentWeekDay": rng.choice(FIXED_LABELS["AccidentWeekDay"], n),
+            "AccidentHour": rng.choice(FIXED_LABELS["AccidentHour"], n),
+            "AccidentSeverityCategory_de": df["AccidentSeverityCategory_de"].astype(str),
+            "AccidentType_de": df["AccidentType_de"].astype(str),
+        })))
+    return TemporalCube.from_grouped(pd.concat(rows, ignore_index=True))
+
+
+def synthetic_source(years, multiplier, with_cube=False):
+    from data_source import InMemoryDataSource
+    from mongo_data_layer import MAP_COUNTS_STAT
+    from data_tools.build_stats import group_frame, build_stat_documents
+
+    rng = np.random.default_rng(SEED)
+    frames = {year: synthetic_year(year, ACCIDENTS_PER_YEAR * multiplier, rng) for year in years}
+    grouped = pd.concat([group_frame(df) for df in frames.values()], ignore_index=True)
+    documents = build_stat_documents(grouped)
+    counts = {str(stats["year"]): stats for stats in documents.pop(MAP_COUNTS_STAT)["data"]}
+    cube = synthetic_cube(frames, rng) if with_cube else None
+    return InMemoryDataSource(frames, counts, documents, version="benchmark", cube=cube)
+
+
+def figure_size(figures) -> int:
+    import plotly.io
+
+    size = 0
+    for fig in figures:
+        if isinstance(fig, bytes):
+            size += len(fig)
+        else:
+            size += len(json.dumps(fig)) if isinstance(fig, dict) else len(plotly.io.to_json(fig))
+    return size
+
+
+def run_scenario(scenario, scale, repeats) -> dict:
+    years, multiplier = SCALES[scale]
+    year_range = [int(years[0]), int(years[-1])]
+
+    # the figure scenarios measure the server side figures, the tile scenario the tiles the browser would fetch
+    os.environ["MAP_VECTOR_TILES"] = "0"
+
+    import accident_cache
+    source = synthetic_source(years, multiplier, with_cube=scenario == "temporal")
+    cache = accident_cache.use_source(source)
+
+    import dash_unfaelle_map
+    import dash_unfaelle_animation_years
+    import vector_tiles
+    from data_tools.build_stats import group_frame, build_stat_documents
+
+    # zoomed into Zurich, so the points scenario exercises the viewport query
+    zurich = {"mapbox.zoom": 11, "mapbox._derived": {"coordinates": [[8.4, 47.45], [8.65, 47.45], [8.65, 47.3], [8.4, 47.3]]}}
+
+    no_filters = [None, None, None, None, []]
+
+    def map_bins():
+        return [dash_unfaelle_map.update_map(year_range, "AccidentSeverityCategory_de", None, *no_filters, [], None)[0]]
+
+    def map_points():
+        return [dash_unfaelle_map.update_map(year_range, "AccidentType_de", zurich, *no_filters, [], None)[0]]
+
+    def map_tiles():
+        # the zoom 8 tiles of Switzerland and the zoom 14 tiles of Zurich, without the disk cache
+        df = cache.get_frame(dash_unfaelle_map.year_key(year_range))
+        tiles = [(8, x, y) for x in range(132, 136) for y in range(89, 92)]
+        tiles += [(14, x, y) for x in range(8579, 8583) for y in range(5732, 5736)]
+        return [vector_tiles.build_tile(df, "AccidentType_de", z, x, y) for z, x, y in tiles]
+
+    def spatial():
+        # 100 clicks around Zurich with the 500 m summary, nearest neighbours and the hotspot ranking
+        import spatial_index
+        indexes = [cache.get_spatial_index(y) for y in years]
+        lons = np.linspace(8.45, 8.6, 10)
+        lats = np.linspace(47.33, 47.42, 10)
+        for lon in lons:
+            for lat in lats:
+                dash_unfaelle_map.nearby_summary(year_range, lat, lon)
+                spatial_index.nearest(indexes, lon, lat, 10)
+        return [{"hotspots": spatial_index.hotspots(indexes)}]
+
+    def charts():
+        return list(dash_unfaelle_map.update_charts(year_range, "AccidentType_de", *no_filters))
+
+    def crossfilter():
+        # severe bicycle accidents on main roads of three cantons, map bins and chart counts
+        filters = [SEVERITIES[1:], None, ["Hauptstrasse"], ["ZH", "BE", "GE"], ["bike"]]
+        return [dash_unfaelle_map.update_map(year_range, "AccidentType_de", None, *filters, [], None)[0],
+                *dash_unfaelle_map.update_charts(year_range, "AccidentType_de", *filters)]
+
+    def anim():
+        dash_unfaelle_animation_years._figures.clear()
+        return list(dash_unfaelle_animation_years.update_map("allYearly"))
+
+    def temporal():
+        dash_unfaelle_animation_years._figures.clear()
+        return list(dash_unfaelle_animation_years.update_temporal(SEVERITIES[1]))
+
+    def stats_build():
+        frames = [cache.get_year(y) for y in years]
+        build_stat_documents(pd.concat([group_frame(df) for df in frames], ignore_index=True))
+        return []
+
+    fn = locals()[scenario]
+    # the first run warms the year cache and imports, it is reported separately from the steady state
+    start = time.perf_counter()
+    figures = fn()
+    cold = time.perf_counter() - start
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+
+    return {
+        "scenario": scenario,
+        "scale": scale,
+        "accidents": sum(len(cache.get_year(y)) for y in years),
+        "cold_seconds": round(cold, 4),
+        "median_seconds": round(statistics.median(timings), 4),
+        "min_seconds": round(min(timings), 4),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "figure_json_bytes": figure_size(figures),
+    }
+
+
+def compare(results, baseline_path):
+    with open(baseline_path, 'r') as file:
+        baseline = {(r["scenario"], r["scale"]): r for r in json.load(file)["results"]}
+    print(f"{'scenario':<12} {'scale':<7} {'time':>8} {'rss':>8} {'json':>8}  (ratio to baseline)")
+    for r in results:
+        b = baseline.get((r["scenario"], r["scale"]))
+        if b is None:
+            continue
+        ratios = [r[k] / b[k] if b[k] else float("nan") for k in ["median_seconds", "peak_rss_mb", "figure_json_bytes"]]
+        print(f"{r['scenario']:<12} {r['scale']:<7} " + " ".join(f"{x:>8.2f}" for x in ratios))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the data-to-figure pipeline on synthetic data.")
+    parser.add_argument("--scales", nargs="*", default=list(SCALES), choices=list(SCALES))
+    parser.add_argument("--scenarios", nargs="*", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="write the results as JSON, e.g. benchmarks/baseline.json")
+    parser.add_argument("--compare", help="baseline JSON to compare the results with")
+    args = parser.parse_args()
+
+    results = []
+    context = multiprocessing.get_context("spawn")
+    for scale in args.scales:
+        for scenario in args.scenarios:
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                result = executor.submit(run_scenario, scenario, scale, args.repeats).result()
+            print(f"{scenario:<12} {scale:<7} median {result['median_seconds']:.3f}s  cold {result['cold_seconds']:.3f}s  "
+                  f"rss {result['peak_rss_mb']:.0f} MB  json {result['figure_json_bytes'] / 1e6:.2f} MB")
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump({"created": datetime.now(timezone.utc).isoformat(), "python": sys.version.split()[0],
+                       "machine": platform.machine(), "accidents_per_year": ACCIDENTS_PER_YEAR, "seed": SEED,
+                       "results": results}, file, indent=4)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+import time
+
+from flask import g, request
+
+from metrics import STAGE_SECONDS, PAYLOAD_BYTES
+
+# Dash component ids whose values become the year and class_type labels
+_YEAR_INPUTS = {"year_selector", "year_range"}
+_CLASS_INPUTS = {"class_selector", "cat_selector"}
+
+
+def _callback_labels(body) -> tuple:
+    year, class_type = "", ""
+    for item in body.get("inputs", []) + body.get("state", []):
+        if not isinstance(item, dict):
+            continue
+        if item.get("id") in _YEAR_INPUTS:
+            year = item.get("value", "")
+            if isinstance(year, list):
+                # year range slider of the map page
+                first, last = sorted(year)
+                year = str(first) if first == last else f"{first}-{last}"
+        elif item.get("id") in _CLASS_INPUTS:
+            class_type = item.get("value", "")
+    return str(year), str(class_type)
+
+
+def instrument_dash(app, page):
+    # Times every callback request end to end (including Dash's serialization) and records the payload size.
+    server = app.server
+
+    @server.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @server.after_request
+    def _observe_callback(response):
+        if not request.path.endswith("_dash-update-component") or "metrics_start" not in g:
+            return response
+        body = request.get_json(silent=True) or {}
+        year, class_type = _callback_labels(body)
+        STAGE_SECONDS.labels(page, "request", year, class_type).observe(time.perf_counter() - g.metrics_start)
+        if not response.direct_passthrough:
+            PAYLOAD_BYTES.labels(page, str(body.get("output", "")), year, class_type).observe(
+                len(response.get_data()))
+        return response
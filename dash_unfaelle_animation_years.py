@@ -1,23 +1,27 @@
 import json
+import threading
 import time
 
 import dash
 import pandas as pd
 from dash import html, dcc, dash_table, Input, Output
 from plotly import express as px
-# import plotly.graph_objects as go
+import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
 
-from mongo_data_layer import MongoClient
+import accident_cache
+from async_data_layer import call_limited
+from dash_metrics import instrument_dash
+from metrics import timed
 
 _TITLE = "Unfälle mit Personenschäden Schweiz 2011-2023"
 
-mc = MongoClient("unfaelle-schweiz-stats")
-
 # Use a Bootstrap and custom CSS
 external_stylesheets = [dbc.themes.CYBORG, 'assets/style.css']
 
-app = dash.Dash(__name__, title=_TITLE, requests_pathname_prefix='/anim/', external_stylesheets=external_stylesheets)
+app = dash.Dash(__name__, title=_TITLE, requests_pathname_prefix='/anim/', external_stylesheets=external_stylesheets,
+                compress=True)
+instrument_dash(app, "anim")
 
 # Create the table style
 table_style = {'backgroundColor': 'transparent', 'color': 'lightgray', 'textAlign': 'left',
@@ -37,6 +41,11 @@ ddown_options = [{"label": "Fussgänger", "value": "pedestrianYearly"},
                  {"label": "Velos", "value": "bikesYearly"},
                  {"label": "All", "value": "allYearly"},]
 
+severity_order = ["Unfall mit Leichtverletzten", "Unfall mit Schwerverletzten", "Unfall mit Getöteten"]
+temporal_options = [{"label": "All", "value": "all"}] + [{"label": x, "value": x} for x in severity_order]
+weekday_labels = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"]
+month_labels = ["Jan", "Feb", "Mär", "Apr", "Mai", "Jun", "Jul", "Aug", "Sep", "Okt", "Nov", "Dez"]
+
 app.layout = html.Div([
     html.H3([
         "📊 ", _TITLE,
@@ -46,18 +55,22 @@ app.layout = html.Div([
     dcc.Dropdown(options=ddown_options, value="allYearly", id="cat_selector", className="ddown"),
     dcc.Loading(dcc.Graph(id='graph', config={'scrollZoom': True}, style={'height': '55vh'}), type='circle'),
     dcc.Loading(dcc.Graph(id='graph-total', config={'scrollZoom': True}, style={'height': '30vh'}), type='circle'),
+    dcc.RadioItems(
+        id='temporal-severity',
+        options=temporal_options,
+        value='all',
+        labelStyle={'display': 'inline-block', 'margin': '10px'},
+        style={'color': 'lightgray', 'textAlign': 'center'}
+    ),
+    dcc.Loading(dcc.Graph(id='graph-heatmap', style={'height': '35vh'}), type='circle'),
+    dcc.Loading(dcc.Graph(id='graph-season', style={'height': '35vh'}), type='circle'),
 ])
 
-@app.callback(
-    Output('graph', 'figure'),
-    Output('graph-total', 'figure'),
-    Input('cat_selector', 'value'),
-)
-def update_map(cat):
-    print(f"Collecting and displaying data for year...")
+def build_figures(cat):
+    print(f"Building figures for {cat}...")
     variable = 'AccidentYear'
 
-    doc = mc.get_single_doc_from_collection("accidentStat", cat)
+    doc = accident_cache.cache.get_stats(cat)
     counts = pd.DataFrame(doc["data"])
 
     print(counts.columns)
@@ -124,5 +137,90 @@ def update_map(cat):
     return fig, fig_total
 
 
+def style_temporal_figure(fig, title):
+    fig.update_layout(
+        title=title,
+        legend=dict(title="", orientation="h", y=-0.3, x=0.5, xanchor='center', yanchor='bottom'),
+        plot_bgcolor='rgba(0,0,0,0)',
+        paper_bgcolor='rgba(0,0,0,0)',
+        font=dict(color='lightgray'),
+        margin={"r": 50, "t": 50, "l": 50, "b": 20},
+    )
+    return fig
+
+
+def build_temporal_figures(severity):
+    # weekday x hour heatmap and accidents per month and year, both roll-ups of the temporal cube
+    print(f"Building temporal figures for {severity}...")
+    cube = accident_cache.cache.get_cube()
+    if cube is None:
+        return (style_temporal_figure(go.Figure(), "Zeitliche Auswertung nicht verfügbar"),
+                style_temporal_figure(go.Figure(), ""))
+    where = {} if severity == "all" else {"AccidentSeverityCategory_de": [severity]}
+
+    fig_heatmap = go.Figure(go.Heatmap(
+        z=cube.rollup(["AccidentWeekDay", "AccidentHour"], **where), x=cube.labels["AccidentHour"], y=weekday_labels,
+        colorscale="Inferno", hovertemplate="%{y} %{x}h<br>Count: %{z}<extra></extra>",
+    ))
+    fig_heatmap.update_yaxes(autorange="reversed")
+
+    season = cube.rollup_frame(["AccidentYear", "AccidentMonth"], **where)
+    season["AccidentMonth"] = season["AccidentMonth"].map(dict(zip(cube.labels["AccidentMonth"], month_labels)))
+    fig_season = px.line(season, x="AccidentMonth", y="count", color="AccidentYear")
+    fig_season.update_xaxes(title="")
+    fig_season.update_yaxes(title="")
+
+    return (style_temporal_figure(fig_heatmap, "Wochentag und Stunde"),
+            style_temporal_figure(fig_season, "Unfälle pro Monat"))
+
+
+# serialized figures per (builder, category, data version), there are only as many entries as options
+_figures = {}
+_figures_lock = threading.Lock()
+
+
+def get_figures(cat, build=build_figures):
+    version = accident_cache.cache.current_version()
+    key = (build.__name__, cat, version)
+    figures = _figures.get(key)
+    if figures is not None:
+        return figures
+
+    with _figures_lock:
+        figures = _figures.get(key)
+        if figures is None:
+            # plain JSON dicts are serialized by Dash without any pandas or Plotly work
+            with timed("anim", "figure", class_type=cat):
+                figures = tuple(json.loads(fig.to_json()) for fig in build(cat))
+            for old in [old for old in _figures if old[-1] != version]:
+                del _figures[old]
+            _figures[key] = figures
+    return figures
+
+
+def prebuild_figures():
+    for option in ddown_options:
+        get_figures(option["value"])
+    get_figures("all", build_temporal_figures)
+
+
+@app.callback(
+    Output('graph', 'figure'),
+    Output('graph-total', 'figure'),
+    Input('cat_selector', 'value'),
+)
+def update_map(cat):
+    return call_limited("anim", get_figures, cat)
+
+
+@app.callback(
+    Output('graph-heatmap', 'figure'),
+    Output('graph-season', 'figure'),
+    Input('temporal-severity', 'value'),
+)
+def update_temporal(severity):
+    return call_limited("anim", get_figures, severity, build_temporal_figures)
+
+
 if __name__ == '__main__':
     app.run_server(debug=True)
@@ -1,21 +1,33 @@
-import time
+import math
+import os
+from urllib.parse import quote
+
 import dash
+import flask
+import numpy as np
 import pandas as pd
-from dash import html, dcc, Input, Output, State
+from dash import html, dcc, Input, Output, State, Patch
 from plotly import express as px
 import plotly.graph_objects as go
 import dash_bootstrap_components as dbc
+from dash.exceptions import PreventUpdate
 
-from mongo_data_layer import MongoClient
+import accident_cache
+import query_engine
+import spatial_binning
+import spatial_index
+from async_data_layer import call_limited, map_route
+from dash_metrics import instrument_dash
+from metrics import timed
 
 _TITLE = "Unfälle mit Personenschäden Schweiz 2011-2023"
 
-mc = MongoClient("unfaelle-schweiz")
-
 # Use a Bootstrap CSS URL
 external_stylesheets = [dbc.themes.CYBORG, 'assets/style.css']
 
-app = dash.Dash(__name__, external_stylesheets=external_stylesheets, title=_TITLE, requests_pathname_prefix='/map/')
+app = dash.Dash(__name__, external_stylesheets=external_stylesheets, title=_TITLE, requests_pathname_prefix='/map/',
+                compress=True)
+instrument_dash(app, "map")
 
 # Create the table style
 table_style = {'backgroundColor': 'transparent', 'color': 'lightgray', 'textAlign': 'left',
@@ -31,9 +43,34 @@ custom_colors = {
     "Unfall mit Getöteten": "Crimson"
 }
 
+severity_order = ["Unfall mit Leichtverletzten", "Unfall mit Schwerverletzten", "Unfall mit Getöteten"]
+
+# below this zoom level the map shows grid cells aggregated on the server instead of single accidents
+RAW_POINTS_ZOOM = 10
+DEFAULT_ZOOM = 7
+DEFAULT_CENTER = {"lat": 46.8, "lon": 8.2}
+POINT_SIZE = 20
+# legend entries of the point figure, at least the number of accident types
+LEGEND_SLOTS = 16
+# upper bound for raw points fetched for the visible map extent
+MAX_POINTS = 20000
+# unfiltered maps are drawn from the vector tiles of /tiles, MAP_VECTOR_TILES=0 keeps the point and grid figures
+VECTOR_TILES = os.getenv("MAP_VECTOR_TILES", "1") == "1"
+# public address of the app, mapbox-gl fetches tiles from a web worker and needs absolute urls
+TILE_BASE_URL = os.getenv("TILE_BASE_URL")
+TILE_POINT_RADIUS = 4
+# accidents around a clicked point are summarized within this radius
+CLICK_RADIUS_METERS = 500
+HOTSPOT_COLOR = "Magenta"
+
+
+FIRST_YEAR = 2011
+LAST_YEAR = 2023
 
-ddown_options = [{"label": x, "value": str(x)} for x in range(2011, 2024)]
-# ddown_options.append({"label": "All", "value": "all"})
+# multi-select filters of the map page and the accident column each of them selects on
+filter_columns = {"filter-severity": "AccidentSeverityCategory_de", "filter-type": "AccidentType_de",
+                  "filter-road": "RoadType_de", "filter-canton": "CantonCode"}
+involvement_columns = {"bike": "AccidentInvolvingBicycle", "pedestrian": "AccidentInvolvingPedestrian"}
 
 
 def generate_chart(labels, values, graph_type="Bar", severity=False):
@@ -84,9 +121,10 @@ app.layout = html.Div([
     ]),
     html.Div([
         html.Div([
-            "Jahr: ", dcc.Dropdown(value="2023",
-                                   id="year_selector",
-                                   options=ddown_options, className="ddown"),
+            "Jahre: ", html.Div(dcc.RangeSlider(FIRST_YEAR, LAST_YEAR, 1, value=[LAST_YEAR, LAST_YEAR],
+                                                id="year_range",
+                                                marks={y: f"'{y % 100:02d}" for y in range(FIRST_YEAR, LAST_YEAR + 1)}),
+                                className="range"),
         ], className='ddown-box'),
         html.Div([
             "Typen/Schwere: ", dcc.Dropdown(
@@ -96,8 +134,26 @@ app.layout = html.Div([
                          {"label": "Severity", "value": "AccidentSeverityCategory_de"}], className="ddown")
         ], className='ddown-box'),
     ], className="ddown-container"),
+    html.Div([
+        dcc.Dropdown(id="filter-severity", multi=True, placeholder="Schwere",
+                     options=[{"label": x, "value": x} for x in severity_order], className="filter"),
+        dcc.Dropdown(id="filter-type", multi=True, placeholder="Typ", className="filter"),
+        dcc.Dropdown(id="filter-road", multi=True, placeholder="Strasse", className="filter"),
+        dcc.Dropdown(id="filter-canton", multi=True, placeholder="Kanton", className="filter"),
+        dcc.Checklist(id="filter-involved", options=[{"label": "Velo", "value": "bike"},
+                                                     {"label": "Fussgänger", "value": "pedestrian"}],
+                      value=[], inline=True, inputStyle={'margin': '0 5px 0 10px'}),
+        dcc.Checklist(id="show-hotspots", options=[{"label": "Hotspots", "value": "hotspots"}],
+                      value=[], inline=True, inputStyle={'margin': '0 5px 0 10px'}),
+    ], className="ddown-container"),
 
     dcc.Loading(dcc.Graph(id='map', config={'scrollZoom': True}, style={'height': '55vh'}), type='circle'),
+    dcc.Store(id='map-view'),
+    # drawn points and hotspot markers can be clicked, the vector tile layer cannot, so a point can also be typed
+    html.Div(dcc.Input(id='nearby-point', type='text', debounce=True, className='point',
+                       placeholder='Umkreis von Breite, Länge (z.B. 47.3769, 8.5417)'),
+             style={'textAlign': 'center', 'margin': '5px'}),
+    html.Div(id='nearby-info', style={'color': 'lightgray', 'textAlign': 'center', 'margin': '5px'}),
 
     dcc.RadioItems(
         id='graph-type',
@@ -123,61 +179,18 @@ app.layout = html.Div([
 ])
 
 
-@app.callback(
-    Output('map', 'figure'),
-    # Output('table', 'columns'),
-    # Output('table', 'data'),
-    Output("graph-pie", "figure"),
-    Output("graph-bar", "figure"),  # New output for the bar chart
-    Input('year_selector', 'value'),
-    Input('class_selector', 'value'),
-)
-def update_map(year, class_type):
-    print(f"Collecting and displaying data for year {year}...")
-    # convert mongo db collection to geopandas dataframe
-    init = time.time()
-    if year == "all":
-        docs = mc.get_all_docs_from_collection()
-    else:
-        docs = mc.get_docs_from_collection("properties.AccidentYear", str(year))
-
-    gdf = pd.DataFrame(docs)
-    print(f"Time to fetch data from MongodDB and convert to GeoDataFrame: {time.time() - init:.2f} seconds")
-
-    # reformat geometry and properties columns
-    init = time.time()
-    df = pd.DataFrame([x for x in gdf['properties'].tolist() if x is not None and hasattr(x, '__iter__')])
-    df_geo = pd.DataFrame.from_records([x for x in gdf['geometry'].tolist() if x is not None and hasattr(x, '__iter__')])
-    df_geo = pd.DataFrame.from_records([x for x in df_geo['coordinates'].tolist() if x is not None and hasattr(x, '__iter__')])
-    df_geo.rename(columns={1: "lat", 0: "lon"}, inplace=True)
-
-    # combine the two dataframes
-    gdf = pd.concat([df, df_geo], axis=1)
-    print(f"Time to convert to DataFrame: {time.time() - init:.2f} seconds")
-
-    # sum total number of accidents by AccidentType
-    counts = gdf['AccidentType_de'].value_counts()
-    counts_severity = gdf['AccidentSeverityCategory_de'].value_counts()
-
-    fig = px.scatter_mapbox(gdf, lat='lat', lon='lon',
-                            color=class_type,
-                            zoom=7,
-                            size=[5]*len(gdf),
-                            mapbox_style="open-street-map",
-                            color_continuous_scale="inferno",
-                            hover_data=['AccidentType_de', 'AccidentSeverityCategory_de', 'AccidentInvolvingBicycle'],
-                            color_discrete_map=custom_colors,
-                            # reorder x-axis
-                            category_orders={"AccidentSeverityCategory_de": ["Unfall mit Leichtverletzten",
-                                                                             "Unfall mit Schwerverletzten",
-                                                                             "Unfall mit Getöteten"]},
-                            )
-
-    fig.update_traces(hovertemplate="Type: %{customdata[0]} "
-                                    "<br>Severity: %{customdata[1]} "
-                                    "<br>Coordinates: %{lat}, %{lon}",
-                      )
+# stats keys of the precomputed chart counts per class selection
+stat_keys = {"AccidentType_de": "types", "AccidentSeverityCategory_de": "severities"}
+
+
+def category_colors(class_type, categories):
+    if class_type == "AccidentSeverityCategory_de":
+        return {c: custom_colors.get(c, "Gray") for c in categories}
+    palette = px.colors.qualitative.Plotly
+    return {c: palette[i % len(palette)] for i, c in enumerate(categories)}
 
+
+def style_map_figure(fig):
     fig.update_layout(
         legend=dict(title="", orientation="h", y=-0.1, x=0.5, xanchor='center', yanchor='bottom'),
         coloraxis_showscale=False,
@@ -185,25 +198,307 @@ def update_map(year, class_type):
         font=dict(color='lightgray'),
         mapbox_style="open-street-map",
         margin={"r": 0, "t": 20, "l": 0, "b": 20},
+        # keep the user's zoom and center when the figure is replaced
+        uirevision="map",
     )
+    return fig
 
-    if class_type == "AccidentType_de":
-        labels = [k for k in counts.keys()]
-        values = [v for v in counts.values]
 
+def class_values(gdf, class_type):
+    if class_type == "AccidentSeverityCategory_de":
+        return pd.Categorical(gdf[class_type], categories=severity_order)
+    return pd.Categorical(gdf[class_type])
+
+
+def point_style(gdf, class_type):
+    # Colours of the point trace as integer class codes on a stepwise colorscale, plus the legend entries.
+    # Only this part changes when the class is switched, the coordinates and hover data stay the same.
+    classes = class_values(gdf, class_type)
+    categories = list(classes.categories)
+    colors = category_colors(class_type, categories)
+    k = max(len(categories), 1)
+    colorscale = [[0, "Gray"], [1, "Gray"]]
+    if categories:
+        colorscale = [[(i + j) / k, colors[c]] for i, c in enumerate(categories) for j in (0, 1)]
+    marker = dict(color=classes.codes, colorscale=colorscale, cmin=-0.5, cmax=k - 0.5)
+    legend = [dict(name=c, marker=dict(color=colors[c]), visible=True) for c in categories[:LEGEND_SLOTS]]
+    legend += [dict(name="", marker=dict(color="Gray"), visible=False)] * (LEGEND_SLOTS - len(legend))
+    return marker, legend
+
+
+def build_point_figure(gdf, class_type):
+    marker, legend = point_style(gdf, class_type)
+    fig = go.Figure(go.Scattermapbox(
+        lat=gdf['lat'], lon=gdf['lon'], showlegend=False,
+        marker=dict(size=POINT_SIZE, **marker),
+        customdata=np.stack([gdf['AccidentType_de'].astype(str), gdf['AccidentSeverityCategory_de'].astype(str),
+                             gdf['AccidentInvolvingBicycle'].astype(str)], axis=-1),
+        hovertemplate="Type: %{customdata[0]} "
+                      "<br>Severity: %{customdata[1]} "
+                      "<br>Coordinates: %{lat}, %{lon}<extra></extra>",
+    ))
+    # fixed number of empty traces that only carry the legend, so a class switch can patch them in place
+    for entry in legend:
+        fig.add_trace(go.Scattermapbox(lat=[None], lon=[None], mode="markers", showlegend=True,
+                                       marker=dict(size=10, color=entry["marker"]["color"]),
+                                       name=entry["name"], visible=entry["visible"]))
+    fig.update_layout(mapbox=dict(center=DEFAULT_CENTER, zoom=DEFAULT_ZOOM))
+    return style_map_figure(fig)
+
+
+def patch_point_figure(gdf, class_type) -> Patch:
+    marker, legend = point_style(gdf, class_type)
+    patch = Patch()
+    for key, value in marker.items():
+        patch["data"][0]["marker"][key] = value
+    for i, entry in enumerate(legend, start=1):
+        patch["data"][i]["name"] = entry["name"]
+        patch["data"][i]["marker"]["color"] = entry["marker"]["color"]
+        patch["data"][i]["visible"] = entry["visible"]
+    return patch
+
+
+def build_binned_figure(gdf, class_type, zoom):
+    classes = class_values(gdf, class_type)
+    categories = list(classes.categories)
+    colors = category_colors(class_type, categories)
+
+    bins = spatial_binning.bin_points(gdf['lat'].to_numpy(), gdf['lon'].to_numpy(), classes.codes,
+                                      len(categories), spatial_binning.cell_size_for_zoom(zoom))
+    category_counts = bins["category_counts"]
+    dominant = category_counts.argmax(axis=1) if len(category_counts) else np.empty(0, dtype=np.int64)
+    # marker area grows with the number of accidents in the cell, colour shows the most frequent class
+    sizes = 6 + 24 * np.sqrt(bins["count"] / bins["count"].max(initial=1))
+    hover = ["<br>".join(f"{categories[j]}: {n}" for j, n in enumerate(row) if n) for row in category_counts]
+
+    fig = go.Figure()
+    for i, category in enumerate(categories):
+        idx = (dominant == i).nonzero()[0]
+        if len(idx) == 0:
+            continue
+        fig.add_trace(go.Scattermapbox(
+            lat=bins["lat"][idx], lon=bins["lon"][idx], name=category,
+            marker=dict(size=sizes[idx], color=colors[category], opacity=0.8),
+            customdata=[[bins["count"][j], hover[j]] for j in idx],
+            hovertemplate="Accidents: %{customdata[0]}<br>%{customdata[1]}<extra></extra>",
+        ))
+    fig.update_layout(mapbox=dict(center=DEFAULT_CENTER, zoom=DEFAULT_ZOOM))
+    return style_map_figure(fig)
+
+
+def tile_url(base_url, year, class_type) -> str:
+    # the data version in the url lets browsers and CDNs keep tiles until the data changes
+    version = quote(str(accident_cache.cache.current_version()))
+    return f"{base_url.rstrip('/')}/tiles/{year}/{{z}}/{{x}}/{{y}}.pbf?cls={class_type}&v={version}"
+
+
+def build_tile_figure(categories, class_type, url):
+    # an empty trace for the map itself, one circle layer per tile layer (class label) and the legend entries
+    colors = category_colors(class_type, categories)
+    fig = go.Figure(go.Scattermapbox(lat=[], lon=[], showlegend=False, hoverinfo="skip"))
+    for c in categories[:LEGEND_SLOTS]:
+        fig.add_trace(go.Scattermapbox(lat=[None], lon=[None], mode="markers", showlegend=True,
+                                       marker=dict(size=10, color=colors[c]), name=c))
+    layers = [dict(sourcetype="vector", source=[url], sourcelayer=c, type="circle", color=colors[c],
+                   circle=dict(radius=TILE_POINT_RADIUS), opacity=0.8) for c in categories]
+    fig.update_layout(mapbox=dict(center=DEFAULT_CENTER, zoom=DEFAULT_ZOOM, layers=layers))
+    return style_map_figure(fig)
+
+
+def frame_categories(years, column) -> list:
+    # labels of the selected years, taken from the categories of the cached frames
+    labels = set()
+    for y in selected_years(years):
+        frame = accident_cache.cache.get_year(y)
+        if column in frame:
+            labels.update(frame[column].cat.categories)
+    return sorted(labels)
+
+
+def hotspot_trace(hotspots):
+    # the densest accident clusters as ranked circles, clicking one summarizes the accidents around it
+    counts = np.array([h["count"] for h in hotspots], dtype=float)
+    return go.Scattermapbox(
+        lat=[h["lat"] for h in hotspots], lon=[h["lon"] for h in hotspots], name="Hotspots",
+        mode="markers+text", text=[str(i) for i in range(1, len(hotspots) + 1)], textfont=dict(color="white"),
+        marker=dict(size=14 + 26 * np.sqrt(counts / counts.max(initial=1)), color=HOTSPOT_COLOR, opacity=0.6),
+        customdata=counts, hovertemplate="Hotspot %{text}<br>Accidents: %{customdata}<extra></extra>",
+    )
+
+
+def get_zoom(relayout_data):
+    if relayout_data and "mapbox.zoom" in relayout_data:
+        return relayout_data["mapbox.zoom"]
+    return DEFAULT_ZOOM
+
+
+def get_query_bounds(relayout_data, zoom):
+    # Visible extent as (west, south, east, north), snapped outwards to the tile grid of the zoom level
+    # with one tile margin, so small pans stay inside the bounds that were already queried.
+    derived = (relayout_data or {}).get("mapbox._derived")
+    if not derived or "coordinates" not in derived:
+        return None
+    lons = [c[0] for c in derived["coordinates"]]
+    lats = [c[1] for c in derived["coordinates"]]
+    step = 360.0 / 2 ** int(zoom)
+    return (math.floor(min(lons) / step) * step - step, math.floor(min(lats) / step) * step - step,
+            math.ceil(max(lons) / step) * step + step, math.ceil(max(lats) / step) * step + step)
+
+
+def selected_years(years) -> list:
+    first, last = sorted(int(y) for y in years)
+    return [str(y) for y in range(first, last + 1)]
+
+
+def year_key(years) -> str:
+    # single year, "all" or a range like "2015-2019", the precomputed counts exist for the first two
+    years = selected_years(years)
+    if len(years) == 1:
+        return years[0]
+    if years == selected_years([FIRST_YEAR, LAST_YEAR]):
+        return "all"
+    return f"{years[0]}-{years[-1]}"
+
+
+def make_filters(severities, types, roads, cantons, involved) -> dict:
+    # query_engine filter: AND over the dropdowns, OR within one dropdown and over the involvement flags
+    filters = {column: values for column, values in
+               zip(filter_columns.values(), [severities, types, roads, cantons]) if values}
+    if involved:
+        filters[query_engine.ANY] = [{involvement_columns[k]: [True]} for k in involved]
+    return filters
+
+
+def select_accidents(years, filters, bounds):
+    year = year_key(years)
+    if not filters and (year == "all" or year.isdigit()):
+        if bounds is not None:
+            # zoomed in: only the visible extent is queried, capped at MAX_POINTS
+            return accident_cache.cache.get_box(year, bounds, MAX_POINTS)
+        # per-year frames are cached, so switching the class only recolours already decoded data
+        return accident_cache.cache.get_frame(year)
+    # filters and year ranges are answered from the bitmap indexes of the cached year frames
+    indexes = [accident_cache.cache.get_index(y) for y in selected_years(years)]
+    return query_engine.select(indexes, filters, bounds, MAX_POINTS if bounds is not None else None)
+
+
+filter_inputs = [Input(component, 'value') for component in list(filter_columns) + ["filter-involved"]]
+
+
+@app.callback(
+    Output('map', 'figure'),
+    Output('map-view', 'data'),
+    # Output('table', 'columns'),
+    # Output('table', 'data'),
+    Input('year_range', 'value'),
+    Input('class_selector', 'value'),
+    Input('map', 'relayoutData'),
+    *filter_inputs,
+    Input('show-hotspots', 'value'),
+    State('map-view', 'data'),
+)
+def update_map(years, class_type, relayout_data, severities, types, roads, cantons, involved, show_hotspots, view):
+    year = year_key(years)
+    filters = make_filters(severities, types, roads, cantons, involved)
+    zoom = get_zoom(relayout_data)
+    if VECTOR_TILES and not filters and (year == "all" or year.isdigit()):
+        # the browser fetches the visible tiles by itself, zooming and panning never reach the server
+        mode = "tiles"
     else:
-        labels = [k for k in counts_severity.keys()]
-        values = [v for v in counts_severity.values]
+        # grid resolution follows integer zoom levels, raw points do not depend on the zoom at all
+        mode = "points" if zoom >= RAW_POINTS_ZOOM else "bins"
+    level = int(zoom) if mode == "bins" else None
+    bounds = get_query_bounds(relayout_data, zoom) if mode == "points" else None
+    new_view = {"year": year, "class_type": class_type, "mode": mode, "level": level,
+                "bounds": list(bounds) if bounds else None, "filters": filters, "hotspots": bool(show_hotspots)}
+    if new_view == view:
+        # panning or zooming within the same level does not change the figure
+        raise PreventUpdate
+
+    # only the class changed on a point figure: recolour it without sending the coordinates again
+    recolour = mode == "points" and view is not None and \
+        {k: v for k, v in view.items() if k != "class_type"} == {k: v for k, v in new_view.items() if k != "class_type"}
+
+    print(f"Collecting and displaying data for year {year} ({mode}, zoom {zoom:.1f})...")
+    # data and figure work runs on the bounded workers of its route, see async_data_layer
+    base_url = TILE_BASE_URL or (flask.request.host_url if flask.has_request_context() else "/")
+    fig = call_limited(map_route(year, bounds), render_map, years, class_type, mode, level, bounds, recolour,
+                       filters, base_url, bool(show_hotspots))
+    return fig, new_view
+
+
+def render_map(years, class_type, mode, level, bounds, recolour=False, filters=None, base_url="", hotspots=False):
+    fig = render_base_map(years, class_type, mode, level, bounds, recolour, filters, base_url)
+    if hotspots and not recolour:
+        # ranked per severity when exactly one severity is filtered
+        severities = (filters or {}).get("AccidentSeverityCategory_de") or []
+        severity = severities[0] if len(severities) == 1 else None
+        fig.add_trace(hotspot_trace(accident_cache.cache.get_hotspots(selected_years(years), severity)))
+    return fig
+
+
+def render_base_map(years, class_type, mode, level, bounds, recolour=False, filters=None, base_url=""):
+    year = year_key(years)
+    if mode == "tiles":
+        with timed("map", "figure_tiles", year, class_type):
+            categories = severity_order if class_type == "AccidentSeverityCategory_de" \
+                else frame_categories(years, class_type)
+            return build_tile_figure(categories, class_type, tile_url(base_url, year, class_type))
+
+    with timed("map", "data", year, class_type):
+        gdf = select_accidents(years, filters or {}, bounds)
+
+    with timed("map", f"figure_{mode}", year, class_type):
+        if recolour:
+            fig = patch_point_figure(gdf, class_type)
+        elif mode == "points":
+            fig = build_point_figure(gdf, class_type)
+        else:
+            fig = build_binned_figure(gdf, class_type, level)
+    return fig
+
+
+@app.callback(
+    Output("graph-pie", "figure"),
+    Output("graph-bar", "figure"),  # New output for the bar chart
+    Input('year_range', 'value'),
+    Input('class_selector', 'value'),
+    *filter_inputs,
+)
+def update_charts(years, class_type, severities, types, roads, cantons, involved):
+    filters = make_filters(severities, types, roads, cantons, involved)
+    return call_limited("charts", render_charts, years, class_type, filters)
+
+
+def render_charts(years, class_type, filters=None):
+    year = year_key(years)
+    # charts come from the precomputed counts, so they render without waiting for the map data
+    with timed("charts", "data", year, class_type):
+        if filters or not (year == "all" or year.isdigit()):
+            indexes = [accident_cache.cache.get_index(y) for y in selected_years(years)]
+            stats = {stat_keys[class_type]: query_engine.count(indexes, filters or {}, class_type)}
+        else:
+            stats = accident_cache.cache.get_counts(year)
+    if stats is not None:
+        counts = stats[stat_keys[class_type]]
+        labels = list(counts.keys())
+        values = list(counts.values())
+    else:
+        print(f"No precomputed counts for year {year}, counting raw data...")
+        counts = accident_cache.cache.get_frame(year)[class_type].value_counts()
+        labels = [k for k in counts.keys()]
+        values = [v for v in counts.values]
 
     if class_type == "AccidentSeverityCategory_de":
         severity = True
     else:
         severity = False
 
-    fig_pie = generate_chart(labels, values, "Pie", severity=severity)  # Always generate the pie chart
-    fig_bar = generate_chart(labels, values, "Bar", severity=severity)  # Always generate the bar chart
+    with timed("charts", "figure", year, class_type):
+        fig_pie = generate_chart(labels, values, "Pie", severity=severity)  # Always generate the pie chart
+        fig_bar = generate_chart(labels, values, "Bar", severity=severity)  # Always generate the bar chart
 
-    return fig, fig_pie, fig_bar  # Return both charts
+    return fig_pie, fig_bar  # Return both charts
 
 
 @app.callback(
@@ -218,15 +513,100 @@ def toggle_graphs(graph_type):
         return {'display': 'none'}, {'display': 'block'}
 
 
+@app.callback(
+    Output('nearby-info', 'children'),
+    Input('map', 'clickData'),
+    Input('nearby-point', 'value'),
+    State('year_range', 'value'),
+)
+def show_nearby(click, text, years):
+    if dash.callback_context.triggered_id == "nearby-point":
+        if not text:
+            raise PreventUpdate
+        point = parse_point(text)
+        if point is None:
+            return "Koordinaten als Breite, Länge eingeben, z.B. 47.3769, 8.5417"
+        lat, lon = point
+    else:
+        if not click or not click.get("points"):
+            raise PreventUpdate
+        lat, lon = click["points"][0].get("lat"), click["points"][0].get("lon")
+        if lat is None or lon is None:
+            raise PreventUpdate
+    return call_limited("spatial", nearby_summary, years, lat, lon)
+
+
+def parse_point(text):
+    # "lat, lon" in degrees, None if it cannot be read
+    try:
+        lat, lon = (float(value) for value in text.replace(";", ",").split(","))
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
+def nearby_summary(years, lat, lon):
+    # answered from the grid hash of the year frames, no scan over all accidents
+    with timed("map", "nearby", year_key(years)):
+        indexes = [accident_cache.cache.get_spatial_index(y) for y in selected_years(years)]
+        severities = spatial_index.count_within(indexes, lon, lat, CLICK_RADIUS_METERS, "AccidentSeverityCategory_de")
+        types = spatial_index.count_within(indexes, lon, lat, CLICK_RADIUS_METERS, "AccidentType_de")
+    return [
+        html.B(f"{sum(severities.values())} Unfälle im Umkreis von {CLICK_RADIUS_METERS} m ({lat:.4f}, {lon:.4f})"),
+        html.Div(", ".join(f"{label}: {n}" for label, n in severities.items())),
+        html.Div(", ".join(f"{label}: {n}" for label, n in list(types.items())[:3])),
+    ]
+
+
+@app.callback(
+    Output("filter-type", "options"),
+    Output("filter-road", "options"),
+    Output("filter-canton", "options"),
+    Input('year_range', 'value'),
+)
+def update_filter_options(years):
+    return call_limited("charts", filter_options, years)
+
+
+def filter_options(years):
+    return [[{"label": x, "value": x} for x in frame_categories(years, column)]
+            for column in list(filter_columns.values())[1:]]
+
+
+@app.callback(
+    Output("filter-severity", "value"),
+    Output("filter-type", "value"),
+    Input("graph-bar", "clickData"),
+    Input("graph-pie", "clickData"),
+    State('class_selector', 'value'),
+    State("filter-severity", "value"),
+    State("filter-type", "value"),
+)
+def cross_filter(bar_click, pie_click, class_type, severities, types):
+    # a click on a chart toggles its label in the filter of the shown class
+    click = bar_click if dash.callback_context.triggered_id == "graph-bar" else pie_click
+    if not click:
+        raise PreventUpdate
+    point = click["points"][0]
+    label = point.get("label", point.get("x"))
+    selected = list((severities if class_type == "AccidentSeverityCategory_de" else types) or [])
+    selected = [x for x in selected if x != label] if label in selected else selected + [label]
+    if class_type == "AccidentSeverityCategory_de":
+        return selected, dash.no_update
+    return dash.no_update, selected
+
+
 # Add this callback to your callbacks
 @app.callback(
     Output("modal", "is_open"),
-    [Input("year_selector", "value"),
+    [Input("year_range", "value"),
      Input("close", "n_clicks")],
     [State("modal", "is_open")],
 )
-def toggle_modal(year, n, is_open):
-    if year == "all" or n:
+def toggle_modal(years, n, is_open):
+    if year_key(years) == "all" or n:
         return not is_open
     else:
         return False
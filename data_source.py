@@ -0,0 +1,132 @@
+import os
+
+import pandas as pd
+
+from accident_decoder import decode_documents
+from metrics import timed
+from mongo_data_layer import MongoClient, ACCIDENT_FIELDS, VERSION_COLLECTION, MAP_COUNTS_STAT
+from temporal_cube import TemporalCube, CUBE_STAT
+
+YEARS = [str(x) for x in range(2011, 2024)]
+
+
+class AccidentDataSource():
+    # Interface of the accident dataset used by the Dash apps.
+    # Backends that can filter by bounding box themselves set native_box_query and implement load_box,
+    # for all others the viewport is filtered from the cached year frames.
+    native_box_query = False
+
+    def load_year(self, year) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def load_box(self, year, bounds, limit) -> pd.DataFrame:
+        raise NotImplementedError
+
+    def get_version(self):
+        raise NotImplementedError
+
+    def load_counts(self) -> dict:
+        # chart counts of the map page keyed by year (and "all")
+        raise NotImplementedError
+
+    def get_stats(self, stat):
+        # accidentStat document (allYearly, bikesYearly, pedestrianYearly) of the animation page
+        raise NotImplementedError
+
+    def load_cube(self) -> TemporalCube:
+        # temporal cube built by the data tools, None if it has not been built yet
+        raise NotImplementedError
+
+
+class MongoDataSource(AccidentDataSource):
+    native_box_query = True
+
+    def __init__(self):
+        self.mc = MongoClient("unfaelle-schweiz")
+        self.mc_versions = MongoClient(VERSION_COLLECTION)
+        self.mc_stats = MongoClient("unfaelle-schweiz-stats")
+
+    def load_year(self, year) -> pd.DataFrame:
+        # the cursor is decoded while it is fetched, so fetch and decode are timed as one stage
+        with timed("data", "db_fetch_decode", year):
+            return decode_documents(self.mc.get_projected_docs(ACCIDENT_FIELDS, {"properties.AccidentYear": str(year)}))
+
+    def load_box(self, year, bounds, limit) -> pd.DataFrame:
+        query = None if year == "all" else {"properties.AccidentYear": str(year)}
+        with timed("data", "db_fetch_decode_box", year):
+            return decode_documents(self.mc.get_projected_docs_within_box(ACCIDENT_FIELDS, bounds, query, limit=limit))
+
+    def get_version(self):
+        doc = next(iter(self.mc_versions.get_most_recent_doc_from_collection()), None)
+        if doc is None:
+            return None
+        return doc["Timestamp"]
+
+    def load_counts(self) -> dict:
+        doc = self.mc_stats.get_single_doc_from_collection("accidentStat", MAP_COUNTS_STAT)
+        if doc is None:
+            return {}
+        return {str(stats["year"]): stats for stats in doc["data"]}
+
+    def get_stats(self, stat):
+        return self.mc_stats.get_single_doc_from_collection("accidentStat", stat)
+
+    def load_cube(self) -> TemporalCube:
+        doc = self.mc_stats.get_single_doc_from_collection("accidentStat", CUBE_STAT)
+        if doc is None:
+            return None
+        return TemporalCube.from_bytes(doc["data"])
+
+
+class InMemoryDataSource(AccidentDataSource):
+    # Read-only dataset held completely in RAM, for load tests, benchmarks and edge nodes without a database.
+    def __init__(self, frames: dict, counts: dict = None, stats: dict = None, version="in-memory",
+                 cube: TemporalCube = None):
+        self.frames = {str(year): df for year, df in frames.items()}
+        self.counts = counts or {}
+        self.stats = stats or {}
+        self.version = version
+        self.cube = cube
+
+    @classmethod
+    def from_source(cls, source, years=YEARS):
+        frames = {year: source.load_year(year) for year in years}
+        stats = {}
+        for stat in ["allYearly", "bikesYearly", "pedestrianYearly"]:
+            doc = source.get_stats(stat)
+            if doc is not None:
+                stats[stat] = doc
+        return cls(frames, source.load_counts(), stats, source.get_version(), source.load_cube())
+
+    def load_year(self, year) -> pd.DataFrame:
+        return self.frames[str(year)]
+
+    def get_version(self):
+        return self.version
+
+    def load_counts(self) -> dict:
+        return self.counts
+
+    def get_stats(self, stat):
+        return self.stats.get(stat)
+
+    def load_cube(self) -> TemporalCube:
+        return self.cube
+
+
+def create_data_source(kind=None) -> AccidentDataSource:
+    # ACCIDENT_DATA_SOURCE is "mongo" (default), "snapshot" to serve the memory-mapped Arrow snapshot from
+    # ACCIDENT_SNAPSHOT_DIR offline or "memory" to load that snapshot completely into RAM at startup.
+    # Read on every call, the multi-worker preload points them at its snapshot after this module was imported.
+    kind = kind or os.getenv("ACCIDENT_DATA_SOURCE", "mongo")
+    if kind == "mongo":
+        return MongoDataSource()
+
+    from snapshot_source import LocalSnapshotSource
+
+    snapshot_dir = os.getenv("ACCIDENT_SNAPSHOT_DIR", "data/snapshot")
+    if kind == "snapshot":
+        return LocalSnapshotSource(snapshot_dir)
+    if kind == "memory":
+        return InMemoryDataSource.from_source(LocalSnapshotSource(snapshot_dir))
+    raise ValueError(f"Unknown accident data source: {kind}")
@@ -0,0 +1,172 @@
+import argparse
+import time
+
+import pandas as pd
+from pymongo.errors import OperationFailure
+
+from mongo_data_layer import MongoClient, MAP_COUNTS_STAT
+from temporal_cube import TemporalCube, CUBE_STAT, DIMENSIONS
+from data_tools.load_json_to_mongo import publish_data_version
+from data_tools.unfaelle_statistic import merge_stats
+
+GROUP_FIELDS = ["AccidentYear", "AccidentType_de", "AccidentSeverityCategory_de", "RoadType_de",
+                "AccidentInvolvingBicycle", "AccidentInvolvingPedestrian"]
+
+# accidentStat documents of the animation page and the flag their accidents are selected by
+YEARLY_STATS = {"allYearly": None, "bikesYearly": "AccidentInvolvingBicycle",
+                "pedestrianYearly": "AccidentInvolvingPedestrian"}
+
+# keys of the map page chart counts
+MAP_COUNT_COLUMNS = {"types": "AccidentType_de", "severities": "AccidentSeverityCategory_de",
+                     "roads": "RoadType_de", "bikes": "AccidentInvolvingBicycle"}
+
+
+def match_years(years) -> list:
+    if not years:
+        return []
+    return [{"$match": {"properties.AccidentYear": {"$in": [str(y) for y in years]}}}]
+
+
+def group_stage(fields) -> dict:
+    return {"$group": {"_id": {field: f"$properties.{field}" for field in fields}, "count": {"$sum": 1}}}
+
+
+def grouped_frame(docs, fields) -> pd.DataFrame:
+    rows = [{**doc["_id"], "count": doc["count"]} for doc in docs]
+    return pd.DataFrame(rows, columns=fields + ["count"])
+
+
+def fetch_grouped_counts(mc, years=None) -> tuple:
+    # a single pass over the documents with one $group per builder, the accidentStat documents are derived from
+    # a few thousand rows, grouping the chart fields together with the cube dimensions would leave one per accident
+    facets = {"stats": [group_stage(GROUP_FIELDS)], "cube": [group_stage(DIMENSIONS)]}
+    # the cube rows would not fit into the single document $facet returns, they are unwound into one per group
+    pipeline = match_years(years) + [{"$facet": facets},
+                                     {"$project": {"facet": {"$objectToArray": "$$ROOT"}}},
+                                     {"$unwind": "$facet"}, {"$unwind": "$facet.v"},
+                                     {"$project": {"_id": "$facet.v._id", "facet": "$facet.k", "count": "$facet.v.count"}}]
+    docs = {"stats": [], "cube": []}
+    for doc in mc.aggregate(pipeline):
+        docs[doc["facet"]].append(doc)
+    return grouped_frame(docs["stats"], GROUP_FIELDS), grouped_frame(docs["cube"], DIMENSIONS)
+
+
+def group_frame(df) -> pd.DataFrame:
+    # same rows as the stats facet of fetch_grouped_counts, for accident frames that are already in memory
+    df = df[GROUP_FIELDS].copy()
+    for column in GROUP_FIELDS:
+        # decoded frames hold the involvement flags as booleans, the documents as "true"/"false"
+        if df[column].dtype == bool:
+            df[column] = df[column].map({True: "true", False: "false"})
+    return df.groupby(GROUP_FIELDS, dropna=False, observed=True).size().reset_index(name="count")
+
+
+def densify_yearly_counts(grouped) -> pd.DataFrame:
+    variable = 'AccidentYear'
+    counts = grouped.groupby(['AccidentType_de', 'AccidentSeverityCategory_de', variable])['count'].sum().reset_index()
+
+    # reformat data to guarantee en each row of input is present across all animation frames
+    counts = counts.pivot_table(index=['AccidentType_de', 'AccidentSeverityCategory_de'], columns=variable,
+                                values='count', aggfunc='sum').reset_index()
+    counts = counts.melt(id_vars=['AccidentType_de', 'AccidentSeverityCategory_de'], var_name=variable, value_name='count')
+    counts = counts.fillna(0)
+    return counts
+
+
+def make_map_counts(grouped, year) -> dict:
+    stats = dict(year=str(year))
+    for key, column in MAP_COUNT_COLUMNS.items():
+        counts = grouped.groupby(column)['count'].sum().sort_values(ascending=False)
+        stats[key] = {str(k): int(v) for k, v in counts.items()}
+    return stats
+
+
+def build_stat_documents(grouped, existing: dict = None, years=None) -> dict:
+    # Builds every accidentStat document from grouped counts. With years, grouped only covers those years
+    # and the documents in existing provide the counts of all other years.
+    existing = existing or {}
+    years = [str(y) for y in years] if years else None
+    documents = {}
+
+    for stat, flag in YEARLY_STATS.items():
+        selection = grouped if flag is None else grouped[grouped[flag] == "true"]
+        if years and stat in existing:
+            kept = pd.DataFrame(existing[stat]["data"])
+            # the stored rows are densified, their zeros would keep combinations that no longer occur
+            kept = kept[(kept['count'] > 0) & ~kept['AccidentYear'].astype(str).isin(years)]
+            selection = pd.concat([kept, selection[kept.columns]], ignore_index=True)
+        documents[stat] = {"accidentStat": stat, "data": densify_yearly_counts(selection).to_dict(orient="records")}
+
+    map_counts = {}
+    if years and MAP_COUNTS_STAT in existing:
+        map_counts = {str(stats["year"]): stats for stats in existing[MAP_COUNTS_STAT]["data"]
+                      if str(stats["year"]) not in years}
+    map_counts.pop("all", None)
+    for year, group in grouped.groupby("AccidentYear"):
+        map_counts[str(year)] = make_map_counts(group, year)
+    stats_list = [map_counts[year] for year in sorted(map_counts)]
+    stats_list.append(merge_stats(stats_list))
+    documents[MAP_COUNTS_STAT] = {"accidentStat": MAP_COUNTS_STAT, "data": stats_list}
+    return documents
+
+
+def build_cube(grouped, existing: TemporalCube = None, years=None) -> TemporalCube:
+    # with years, grouped only covers those years and the cells of all other years are kept from existing
+    if years and existing is not None:
+        kept = existing.rollup_frame(DIMENSIONS)
+        kept = kept[(kept["count"] > 0) & ~kept["AccidentYear"].isin([str(y) for y in years])]
+        grouped = pd.concat([kept, grouped], ignore_index=True)
+    return TemporalCube.from_grouped(grouped)
+
+
+def cube_document(cube: TemporalCube) -> dict:
+    # compressed counts, a few hundred KB for all years
+    return {"accidentStat": CUBE_STAT, "data": cube.to_bytes()}
+
+
+def build_stats(years=None, collection="unfaelle-schweiz"):
+    mc = MongoClient(collection)
+    mc_stats = MongoClient("unfaelle-schweiz-stats")
+
+    init = time.time()
+    grouped, cube_grouped = fetch_grouped_counts(mc, years)
+    print(f"Time to group {grouped['count'].sum()} accidents in MongoDB: {time.time() - init:.2f} seconds")
+
+    existing = {}
+    if years:
+        for stat in list(YEARLY_STATS) + [MAP_COUNTS_STAT]:
+            doc = mc_stats.get_single_doc_from_collection("accidentStat", stat)
+            if doc is not None:
+                existing[stat] = doc
+
+    for stat, document in build_stat_documents(grouped, existing, years).items():
+        mc_stats.replace_document("accidentStat", stat, document)
+        print(f"Uploaded {stat} with {len(document['data'])} rows")
+
+    init = time.time()
+    existing_cube = None
+    if years:
+        doc = mc_stats.get_single_doc_from_collection("accidentStat", CUBE_STAT)
+        if doc is not None:
+            existing_cube = TemporalCube.from_bytes(doc["data"])
+    cube = build_cube(cube_grouped, existing_cube, years)
+    mc_stats.replace_document("accidentStat", CUBE_STAT, cube_document(cube))
+    print(f"Uploaded {CUBE_STAT} with shape {cube.counts.shape} in {time.time() - init:.2f} seconds")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build all accidentStat documents in a single aggregation pass.")
+    parser.add_argument("--years", nargs="*", help="only rebuild these years, keep the stored counts of all others")
+    parser.add_argument("--collection", default="unfaelle-schweiz")
+    args = parser.parse_args()
+
+    try:
+        build_stats(args.years, args.collection)
+    except OperationFailure as e:
+        print(f"Stats upload failed with {e}, no data version published")
+        raise SystemExit(1)
+    publish_data_version(args.years or [str(year) for year in range(2011, 2024)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import argparse
+import time
+
+from data_tools.parallel import YEARS, WORKERS
+
+
+def split(args):
+    from data_tools.split_geojson_by_year import split_geojson_by_year
+    split_geojson_by_year(args.years, args.workers)
+
+
+def load(args):
+    from data_tools.load_json_to_mongo import load_years
+    load_years(args.years, args.workers, replace=args.replace)
+
+
+def stats(args):
+    from data_tools.unfaelle_statistic import build_chart_stats, FILEPATH
+    build_chart_stats(args.years, args.workers, args.output or FILEPATH, upload=not args.no_upload)
+
+
+def snapshot(args):
+    from data_tools.export_snapshot import export_snapshot, SNAPSHOT_DIR
+    export_snapshot(args.years, args.directory or SNAPSHOT_DIR, args.workers)
+
+
+def rebuild(args):
+    # replaces the documents of the years and rebuilds every accidentStat document from the database,
+    # the new data version is published only once the stats match the documents
+    from data_tools.build_stats import build_stats
+    from data_tools.load_json_to_mongo import load_years, publish_data_version
+    split(args)
+    load_years(args.years, args.workers, replace=True, publish=False)
+    build_stats(args.years)
+    publish_data_version([str(year) for year in args.years])
+
+
+def main():
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--years", nargs="+", default=YEARS)
+    common.add_argument("--workers", type=int, default=WORKERS, help="processes, defaults to DATA_TOOLS_WORKERS or all cores")
+
+    parser = argparse.ArgumentParser(description="Offline data tools, per-year work runs in a process pool.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("split", parents=[common],
+                        help="split the full GeoJSON export into data/unfaelle_<year>.geojson").set_defaults(run=split)
+    load_parser = commands.add_parser("load", parents=[common], help="insert the per-year GeoJSON files into MongoDB")
+    load_parser.add_argument("--replace", action="store_true", help="delete the stored documents of the years first")
+    load_parser.set_defaults(run=load)
+    stats_parser = commands.add_parser("stats", parents=[common],
+                                       help="count the map page chart statistics of the per-year files")
+    snapshot_parser = commands.add_parser("snapshot", parents=[common],
+                                          help="export the per-year files into an Arrow snapshot")
+    commands.add_parser("rebuild", parents=[common], help="split, replace the years in MongoDB and rebuild all "
+                        "stats from the database").set_defaults(run=rebuild)
+    stats_parser.add_argument("--output", help="defaults to data/stats_all.json")
+    stats_parser.add_argument("--no-upload", action="store_true", help="only write the JSON file")
+    stats_parser.set_defaults(run=stats)
+    snapshot_parser.add_argument("--directory")
+    snapshot_parser.set_defaults(run=snapshot)
+    args = parser.parse_args()
+
+    init = time.time()
+    args.run(args)
+    print(f"{args.command} finished in {time.time() - init:.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import json
+import os
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+import pandas as pd
+
+from mongo_data_layer import MAP_COUNTS_STAT
+from snapshot_source import snapshot_path, frame_to_table, write_table, write_metadata, write_cube
+from temporal_cube import group_cube_rows
+from data_tools.build_stats import group_frame, build_stat_documents, build_cube
+from data_tools.parallel import map_years, YEARS, WORKERS
+
+SNAPSHOT_DIR = os.getenv("ACCIDENT_SNAPSHOT_DIR", "data/snapshot")
+
+
+def get_data(year):
+    filepath = f"data/unfaelle_{year}.geojson"
+    print(f"Reading file {filepath}...")
+    with open(filepath, 'r') as file:
+        return json.load(file)["features"]
+
+
+def features_to_frame(features) -> pd.DataFrame:
+    df = pd.DataFrame([f["properties"] for f in features])
+    coordinates = [f["geometry"]["coordinates"] for f in features]
+    df["lon"] = [c[0] for c in coordinates]
+    df["lat"] = [c[1] for c in coordinates]
+    return df
+
+
+def export_year(year, directory=SNAPSHOT_DIR) -> pd.DataFrame:
+    init = time.time()
+    df = features_to_frame(get_data(year))
+    path = snapshot_path(directory, year)
+    write_table(frame_to_table(df), path)
+    print(f"Wrote {len(df)} accidents to {path} in {time.time() - init:.2f} seconds")
+    # only the grouped counts go back to the parent process
+    return group_frame(df), group_cube_rows(df)
+
+
+def export_snapshot(years=YEARS, directory=SNAPSHOT_DIR, workers=WORKERS):
+    os.makedirs(directory, exist_ok=True)
+    years = [str(year) for year in years]
+    grouped, cube_rows = zip(*map_years(partial(export_year, directory=directory), years, workers))
+
+    write_cube(directory, build_cube(pd.concat(cube_rows, ignore_index=True)))
+    documents = build_stat_documents(pd.concat(grouped, ignore_index=True))
+    counts_list = documents.pop(MAP_COUNTS_STAT)["data"]
+    write_metadata(directory, counts_list, documents, datetime.now(timezone.utc).isoformat(), years)
+
+
+if __name__ == "__main__":
+    export_snapshot()
+    print("Done!")
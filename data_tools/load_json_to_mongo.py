@@ -1,5 +1,8 @@
 import json
-from mongo_data_layer import MongoClient
+from datetime import datetime, timezone
+
+from mongo_data_layer import MongoClient, VERSION_COLLECTION
+from data_tools.parallel import map_years, YEARS, WORKERS
 
 
 def get_data(year):
@@ -15,6 +18,29 @@ def load_mongo_atlas(data):
     mc = MongoClient("unfaelle-schweiz")
     res = mc.insert_many_documents(doc_collection)
     print(f"Inserted {len(res.inserted_ids)} documents.")
+    return len(res.inserted_ids)
+
+
+def load_year(year, replace=False):
+    if replace:
+        # the documents of the year are replaced, loading a year twice would duplicate every accident
+        res = MongoClient("unfaelle-schweiz").delete_doc_from_collection("properties.AccidentYear", str(year))
+        print(f"Deleted {res.deleted_count} documents of {year}.")
+    return load_mongo_atlas(get_data(year))
+
+
+def create_indexes(collection="unfaelle-schweiz"):
+    mc = MongoClient(collection)
+    index = mc.create_geo_index()
+    print(f"Created index {index}.")
+
+
+def publish_data_version(years):
+    # running apps drop their cached accident frames when they see a newer version document
+    mc = MongoClient(VERSION_COLLECTION)
+    version = {"Timestamp": datetime.now(timezone.utc), "collection": "unfaelle-schweiz", "years": years}
+    mc.insert_many_documents([version])
+    print(f"Published data version {version['Timestamp']} for years {years}")
 
 
 def read_docs_from_mongo_for_year(year: str):
@@ -23,10 +49,18 @@ def read_docs_from_mongo_for_year(year: str):
     return docs
 
 
+def load_years(years=YEARS, workers=WORKERS, replace=False, publish=True):
+    # every worker inserts its own years over its own connection, indexes and the version are done once at the end
+    years = [str(year) for year in years]
+    inserted = map_years(load_year, years, workers, [replace] * len(years))
+    print(f"Inserted {sum(inserted)} documents in total.")
+    create_indexes()
+    if publish:
+        publish_data_version(years)
+
+
 if __name__ == "__main__":
-    for year in range(2011, 2024):
-        data = get_data(year)
-        load_mongo_atlas(data)
+    load_years()
     # docs = read_docs_from_mongo_for_year("2011")
     # print(list(docs.limit(1000)))
 
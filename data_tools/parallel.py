@@ -0,0 +1,22 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+YEARS = [str(year) for year in range(2011, 2024)]
+WORKERS = int(os.getenv("DATA_TOOLS_WORKERS", str(os.cpu_count() or 1)))
+
+
+def map_years(func, years=YEARS, workers=WORKERS, *iterables) -> list:
+    # Runs func(year, *items) for every year in a process pool and returns the results in year order.
+    # Workers are spawned, so they never inherit the MongoDB connections of the parent process.
+    years = [str(year) for year in years]
+    workers = max(1, min(workers, len(years)))
+    init = time.time()
+    if workers == 1:
+        results = list(map(func, years, *iterables))
+    else:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+            results = list(pool.map(func, years, *iterables))
+    print(f"Processed {len(years)} years with {workers} workers in {time.time() - init:.2f} seconds")
+    return results
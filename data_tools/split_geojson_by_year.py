@@ -1,5 +1,7 @@
 import geopandas as gpd
-years = range(2011, 2024)
+
+from data_tools.parallel import map_years, YEARS, WORKERS
+
 # filepath = 'data/unfaelle_small_1000.geojson' # small sample file
 filepath = 'data/unfaelle-personenschaeden_alle_4326.json/RoadTrafficAccidentLocations.json'
 
@@ -9,15 +11,17 @@ def get_data():
     return gpd.read_file(filepath)
 
 
-def split_geojson_by_year():
+def write_year(year, gdf_year):
+    gdf_year.to_file(f"data/unfaelle_{year}.geojson", driver="GeoJSON")
+    print(f"Saved {len(gdf_year)} accidents to file: data/unfaelle_{year}.geojson")
+
+
+def split_geojson_by_year(years=YEARS, workers=WORKERS):
+    # the source file is read once, only the GeoJSON encoding of the years runs in parallel
     gdf = get_data()
-    for year in years:
-        print(f"Processing year {year}")
-        gdf_year = gdf[gdf['AccidentYear'] == str(year)]
-        gdf_year.to_file(f"data/unfaelle_{year}.geojson", driver="GeoJSON")
-        print(f"Saved data to file: data/unfaelle_{year}.geojson")
+    years = [str(year) for year in years]
+    map_years(write_year, years, workers, [gdf[gdf['AccidentYear'] == year] for year in years])
 
 
 if __name__ == "__main__":
     split_geojson_by_year()
-
@@ -0,0 +1,119 @@
+import argparse
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import ijson
+from pymongo import InsertOne
+from pymongo.errors import BulkWriteError
+
+from mongo_data_layer import MongoClient
+from data_tools.load_json_to_mongo import create_indexes, publish_data_version
+
+BATCH_SIZE = 5000
+REPORT_INTERVAL = 10
+
+
+def iter_features(filepath):
+    # features are parsed one at a time, the file is never held in memory as a whole
+    with open(filepath, 'rb') as file:
+        yield from ijson.items(file, 'features.item', use_float=True)
+
+
+def iter_batches(features, batch_size):
+    batch = []
+    for feature in features:
+        batch.append(feature)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class ThroughputReport():
+    def __init__(self, interval=REPORT_INTERVAL):
+        self.interval = interval
+        self.count = 0
+        self.start = time.time()
+        self._last = self.start
+        self._lock = threading.Lock()
+
+    def add(self, n):
+        with self._lock:
+            self.count += n
+            now = time.time()
+            if now - self._last >= self.interval:
+                self._last = now
+                print(f"Inserted {self.count} documents ({self.count / (now - self.start):.0f} docs/s)")
+
+    def summary(self):
+        elapsed = time.time() - self.start
+        print(f"Inserted {self.count} documents in {elapsed:.2f} seconds ({self.count / max(elapsed, 1e-9):.0f} docs/s)")
+
+
+def write_batch(mc, batch, report):
+    res = mc.bulk_write([InsertOne(doc) for doc in batch], ordered=False)
+    report.add(res.inserted_count)
+
+
+def stream_load(filepaths, collection="unfaelle-schweiz", batch_size=BATCH_SIZE, workers=1) -> set:
+    mc = MongoClient(collection)
+    report = ThroughputReport()
+    years = set()
+    # at most two batches per worker are buffered, which bounds peak memory independent of the input size
+    in_flight = threading.BoundedSemaphore(workers * 2)
+
+    def submit(executor, batch):
+        in_flight.acquire()
+        future = executor.submit(write_batch, mc, batch, report)
+        future.add_done_callback(lambda _: in_flight.release())
+        return future
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for filepath in filepaths:
+            print(f"Streaming file {filepath}...")
+            for batch in iter_batches(iter_features(filepath), batch_size):
+                years.update(str(f["properties"]["AccidentYear"]) for f in batch)
+                futures.append(submit(executor, batch))
+                # surface write errors early and forget finished batches
+                for future in [f for f in futures if f.done()]:
+                    future.result()
+                futures = [f for f in futures if not f.done()]
+        for future in futures:
+            future.result()
+
+    report.summary()
+    return years
+
+
+def write_errors(e: BulkWriteError) -> str:
+    errors = e.details.get("writeErrors", [])
+    first = f", first: {errors[0].get('errmsg')}" if errors else ""
+    return f"{len(errors)} write errors{first}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Stream GeoJSON accident files into MongoDB in unordered bulk batches.")
+    parser.add_argument("files", nargs="+", help="GeoJSON feature collections, e.g. data/unfaelle_2023.geojson")
+    parser.add_argument("--collection", default="unfaelle-schweiz")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--drop", action="store_true", help="drop the collection before loading")
+    args = parser.parse_args()
+
+    if args.drop:
+        MongoClient(args.collection).drop_collection()
+    try:
+        years = stream_load(args.files, args.collection, args.batch_size, args.workers)
+    except BulkWriteError as e:
+        # no indexes and no new data version for a partial load
+        print(f"Load failed with {write_errors(e)}")
+        raise SystemExit(1)
+    create_indexes(args.collection)
+    publish_data_version(sorted(years))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+import argparse
+import hashlib
+import json
+
+from pymongo import DeleteMany, ReplaceOne
+from pymongo.errors import BulkWriteError, OperationFailure
+
+from data_source import YEARS
+from mongo_data_layer import MongoClient
+from data_tools.load_json_to_mongo import create_indexes, publish_data_version
+from data_tools.stream_load_to_mongo import iter_features, iter_batches, ThroughputReport, BATCH_SIZE, write_errors
+from data_tools.build_stats import build_stats
+
+UID_KEY = "properties.AccidentUID"
+
+
+def content_hash(feature) -> str:
+    return hashlib.sha1(json.dumps(feature, sort_keys=True, separators=(',', ':')).encode()).hexdigest()
+
+
+def sync_batch(mc, batch, report) -> set:
+    # only new or changed features are written, each keyed on its AccidentUID
+    hashes = {f["properties"]["AccidentUID"]: content_hash(f) for f in batch}
+    existing = {doc["properties"]["AccidentUID"]: doc.get("contentHash")
+                for doc in mc.get_docs_with_values(UID_KEY, hashes.keys(), {UID_KEY: 1, "contentHash": 1})}
+
+    requests = []
+    years = set()
+    for feature in batch:
+        uid = feature["properties"]["AccidentUID"]
+        if existing.get(uid) == hashes[uid]:
+            continue
+        requests.append(ReplaceOne({UID_KEY: uid}, {**feature, "contentHash": hashes[uid]}, upsert=True))
+        years.add(str(feature["properties"]["AccidentYear"]))
+
+    if requests:
+        # raises on write errors, so a failed upsert is never counted or published as synced
+        res = mc.bulk_write(requests, ordered=False)
+        report.add(res.upserted_count + res.modified_count)
+    return years
+
+
+def remove_duplicates(mc) -> set:
+    # plain loads insert a file again on every run, only the first document of each AccidentUID is kept
+    pipeline = [{"$group": {"_id": f"${UID_KEY}", "ids": {"$push": "$_id"},
+                            "year": {"$first": "$properties.AccidentYear"}, "count": {"$sum": 1}}},
+                {"$match": {"count": {"$gt": 1}}}]
+    extras = []
+    years = set()
+    for doc in mc.aggregate(pipeline):
+        extras.extend(doc["ids"][1:])
+        years.add(str(doc["year"]))
+    if extras:
+        mc.bulk_write([DeleteMany({"_id": {"$in": ids}}) for ids in iter_batches(extras, BATCH_SIZE)])
+        print(f"Removed {len(extras)} duplicate accidents of years {sorted(years)}")
+    return years
+
+
+def sync(filepaths, collection="unfaelle-schweiz", batch_size=BATCH_SIZE) -> set:
+    mc = MongoClient(collection)
+    # the unique index makes the upserts idempotent and serves the hash lookups, it cannot be built over duplicates
+    changed_years = remove_duplicates(mc)
+    mc.create_unique_index(UID_KEY)
+    report = ThroughputReport()
+    for filepath in filepaths:
+        print(f"Syncing file {filepath}...")
+        for batch in iter_batches(iter_features(filepath), batch_size):
+            changed_years |= sync_batch(mc, batch, report)
+    report.summary()
+    return changed_years
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Upsert new and changed accidents into MongoDB, keyed on AccidentUID.")
+    parser.add_argument("files", nargs="+", help="GeoJSON feature collections, e.g. data/unfaelle_2023.geojson")
+    parser.add_argument("--collection", default="unfaelle-schweiz")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    try:
+        changed_years = sorted(sync(args.files, args.collection, args.batch_size))
+    except BulkWriteError as e:
+        print(f"Sync failed with {write_errors(e)}, no stats rebuilt and no data version published")
+        raise SystemExit(1)
+    if not changed_years:
+        print("No changes.")
+        return
+    print(f"Changed years: {changed_years}")
+    unknown = [year for year in changed_years if year not in YEARS]
+    if unknown:
+        # the app only serves the years of data_source.YEARS
+        print(f"Years {unknown} are stored but not shown by the app until YEARS is extended")
+    create_indexes(args.collection)
+    try:
+        build_stats(changed_years, args.collection)
+    except OperationFailure as e:
+        print(f"Stats rebuild failed with {e}, no data version published")
+        raise SystemExit(1)
+    publish_data_version(changed_years)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,15 @@
 import json
 import os
+from collections import Counter
 
 import geopandas as gpd
 
+from mongo_data_layer import MongoClient, MAP_COUNTS_STAT
+from data_tools.parallel import map_years, YEARS, WORKERS
+from data_tools.load_json_to_mongo import publish_data_version
+
 FILEPATH = "data/stats_all.json"
+STAT_KEYS = ["types", "severities", "roads", "bikes"]
 
 
 def get_data(year):
@@ -17,37 +23,73 @@ def make_stats(gdf, year):
     severities = gdf['AccidentSeverityCategory_de'].value_counts()
     roads = gdf['RoadType_de'].value_counts()
     bikes = gdf['AccidentInvolvingBicycle'].value_counts()
-    stats = dict(year=year, types=types.to_dict(), severities=severities.to_dict(), roads=roads.to_dict(),
-                 bikes=bikes.to_dict())
+    stats = dict(year=str(year), types=_to_counts(types), severities=_to_counts(severities), roads=_to_counts(roads),
+                 bikes=_to_counts(bikes))
     return stats
 
 
-def append_dict_to_json(file_path, new_data):
-    # Check if the file exists
-    if os.path.exists(file_path):
-        # Read the existing data
-        with open(file_path, 'r') as file:
-            try:
-                existing_data = json.load(file)
-            except json.JSONDecodeError:
-                existing_data = []
-    else:
-        existing_data = []
-
-    # Append the new data to the existing data
-    existing_data.append(new_data)
-
-    # Write the updated data back to the file
+def _to_counts(value_counts) -> dict:
+    # string keys and plain ints so the counts can be stored as a MongoDB document
+    return {str(k): int(v) for k, v in value_counts.items()}
+
+
+def merge_stats(stats_list, year="all"):
+    merged = dict(year=year)
+    for key in STAT_KEYS:
+        total = Counter()
+        for stats in stats_list:
+            total.update(stats[key])
+        merged[key] = dict(total.most_common())
+    return merged
+
+
+def upload_stats(stats_list):
+    # replace the chart counts read by the map page
+    mc = MongoClient("unfaelle-schweiz-stats")
+    mc.replace_document("accidentStat", MAP_COUNTS_STAT, {"accidentStat": MAP_COUNTS_STAT, "data": stats_list})
+    print(f"Uploaded chart counts for {len(stats_list)} years to MongoDB")
+    # running apps only reload the counts when the data version changes
+    publish_data_version([stats["year"] for stats in stats_list if stats["year"] != "all"])
+
+
+def year_stats(year):
+    return make_stats(get_data(year), year)
+
+
+def write_stats(file_path, stats_list):
+    # the merged counts of all years are written in one go
     with open(file_path, 'w') as file:
-        json.dump(existing_data, file, indent=4)
+        json.dump(stats_list, file, indent=4)
+
+
+def stored_stats(file_path, upload) -> list:
+    # the chart counts the new years are merged into, from MongoDB or without upload from the JSON file
+    if upload:
+        doc = MongoClient("unfaelle-schweiz-stats").get_single_doc_from_collection("accidentStat", MAP_COUNTS_STAT)
+        return doc["data"] if doc is not None else []
+    if os.path.exists(file_path):
+        with open(file_path) as file:
+            return json.load(file)
+    return []
+
+
+def merge_years(stats_list, existing) -> list:
+    # the counts of the years that were not recounted are kept, "all" is summed again over every year
+    by_year = {str(stats["year"]): stats for stats in existing if str(stats["year"]) != "all"}
+    by_year.update({str(stats["year"]): stats for stats in stats_list})
+    merged = [by_year[year] for year in sorted(by_year)]
+    merged.append(merge_stats(merged))
+    return merged
+
+
+def build_chart_stats(years=YEARS, workers=WORKERS, file_path=FILEPATH, upload=True):
+    stats_list = merge_years(map_years(year_stats, years, workers), stored_stats(file_path, upload))
+    write_stats(file_path, stats_list)
+    if upload:
+        upload_stats(stats_list)
+    return stats_list
 
 
 if "__main__" == __name__:
-    with open(FILEPATH, 'w') as f:
-        json.dump([], f)
-    for year in range(2011, 2024):
-        print(f"Processing year {year}")
-        gdf = get_data(year)
-        stats = make_stats(gdf, year)
-        append_dict_to_json(FILEPATH, stats)
+    build_chart_stats()
     print("Done!")
@@ -0,0 +1,21 @@
+# gunicorn -c gunicorn.conf.py main:app
+# With more than one worker the master decodes the dataset once into shared memory (see shared_dataset.py)
+# before forking, and every worker memory-maps that snapshot instead of querying MongoDB on its own.
+import os
+
+import metrics
+from shared_dataset import preload_shared_snapshot
+
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+worker_class = "uvicorn.workers.UvicornWorker"
+timeout = 600
+
+
+def on_starting(server):
+    metrics.clear_multiprocess_dir()
+    if workers > 1:
+        preload_shared_snapshot()
+
+
+def child_exit(server, worker):
+    metrics.mark_process_dead(worker.pid)
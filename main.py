@@ -1,27 +1,169 @@
+import importlib
+import os
+import threading
+import time
+from contextlib import asynccontextmanager
+
+import anyio
 import uvicorn
 from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
+from fastapi.responses import JSONResponse, RedirectResponse, Response
 from fastapi.middleware.wsgi import WSGIMiddleware
-from dash_unfaelle_map import app as dash_app
-from dash_unfaelle_animation_years import app as dash_app_anim
+import async_data_layer
+
+# background work after startup: "none", "apps" to import the Dash apps and build the animation figures,
+# "all" to additionally load every year into the accident cache
+PREWARM = os.getenv("ACCIDENT_PREWARM", "apps")
+
+
+class LazyWSGI():
+    # The Dash modules pull in plotly express and the dashboard layouts, they are only imported
+    # on the first request of their page (or by the prewarm thread) so the port is bound right away.
+    def __init__(self, module):
+        self.module = module
+        self._app = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._app is not None
+
+    def load(self):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    init = time.time()
+                    self._app = importlib.import_module(self.module).app.server
+                    print(f"Loaded {self.module} in {time.time() - init:.2f} seconds")
+        return self._app
+
+    def __call__(self, environ, start_response):
+        return self.load()(environ, start_response)
+
+
+def overloaded(request, e):
+    return JSONResponse({"detail": str(e)}, status_code=503, headers={"Retry-After": "1"})
+
+
+class LazyRouter():
+    # The data endpoints pull in pandas, numpy, pymongo and the accident cache, so like the Dash apps their
+    # router is only imported on the first request (or by the prewarm thread), served by a small sub-application.
+    def __init__(self, module):
+        self.module = module
+        self._app = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._app is not None
+
+    def load(self):
+        if self._app is None:
+            with self._lock:
+                if self._app is None:
+                    init = time.time()
+                    app = FastAPI()
+                    app.include_router(importlib.import_module(self.module).router)
+                    app.add_exception_handler(async_data_layer.Overloaded, overloaded)
+                    self._app = app
+                    print(f"Loaded {self.module} in {time.time() - init:.2f} seconds")
+        return self._app
+
+    async def __call__(self, scope, receive, send):
+        # the import blocks for a moment, it does not hold up the event loop
+        app = self._app or await anyio.to_thread.run_sync(self.load)
+        await app(scope, receive, send)
+
+
+dash_app = LazyWSGI("dash_unfaelle_map")
+dash_app_anim = LazyWSGI("dash_unfaelle_animation_years")
+api_router = LazyRouter("api")
+tiles_router = LazyRouter("vector_tiles")
+
+
+def prewarm(mode=PREWARM):
+    init = time.time()
+    try:
+        dash_app.load()
+        dash_app_anim.load()
+        api_router.load()
+        tiles_router.load()
+        if mode == "all":
+            import accident_cache
+            accident_cache.cache.prewarm()
+        importlib.import_module("dash_unfaelle_animation_years").prebuild_figures()
+    except Exception as e:
+        # everything that is missing is loaded on the first request instead
+        print(f"Could not prewarm the Dash apps! Exception: {e}")
+    else:
+        print(f"Prewarm finished in {time.time() - init:.2f} seconds")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    print("Starting Dash App...")
+    if PREWARM != "none":
+        threading.Thread(target=prewarm, name="prewarm", daemon=True).start()
+    yield
+    async_data_layer.shutdown()
+    import mongo_data_layer
+    mongo_data_layer.close_clients()
+
 
 # Define the FastAPI server
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Data endpoints run on the same bounded per-route workers as the Dash callbacks
+app.mount("/api", api_router)
+app.mount("/tiles", tiles_router)
 
 # Mount the Dash app as a sub-application in the FastAPI server
-app.mount("/map", WSGIMiddleware(dash_app.server))
-app.mount("/anim", WSGIMiddleware(dash_app_anim.server))
+app.mount("/map", WSGIMiddleware(dash_app))
+app.mount("/anim", WSGIMiddleware(dash_app_anim))
 
 
-@app.on_event("startup")
-def startup_event():
-    print("Starting Dash App...")
+app.add_exception_handler(async_data_layer.Overloaded, overloaded)
+
 
 @app.get("/")
 def index():
     return RedirectResponse(url="/map")
 
 
+@app.get("/ready")
+def ready():
+    # readiness probe: the data source is connected on first use, this succeeds once it answers
+    import accident_cache
+    try:
+        version = accident_cache.cache.current_version()
+    except Exception as e:
+        # the exception can name hosts and the cluster topology, only the log gets it
+        print(f"Readiness check failed! Exception: {e}")
+        return JSONResponse({"ready": False, "error": "data source unavailable"}, status_code=503)
+    return {"ready": True, "version": str(version), "map": dash_app.loaded, "anim": dash_app_anim.loaded}
+
+
+@app.get("/metrics")
+def metrics_endpoint():
+    # Prometheus histograms of the per-stage timings and payload sizes, labelled by page, year and class
+    import metrics
+    return Response(metrics.render(), media_type=metrics.CONTENT_TYPE)
+
+
+def run(workers=int(os.getenv("WEB_CONCURRENCY", "1"))):
+    # Multi-worker entry point: the dataset is decoded once into a shared memory snapshot, the uvicorn workers
+    # are spawned afterwards, inherit the environment pointing at it and memory-map it zero-copy.
+    # With gunicorn use gunicorn.conf.py, which does the same in the master process.
+    import metrics
+    metrics.clear_multiprocess_dir()
+    if workers > 1:
+        from shared_dataset import preload_shared_snapshot
+        preload_shared_snapshot()
+        uvicorn.run("main:app", host="0.0.0.0", port=8000, workers=workers)
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=8000)
+
+
 # Start the FastAPI server
 if __name__ == "__main__":
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    run()
\ No newline at end of file
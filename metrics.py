@@ -0,0 +1,54 @@
+import os
+import time
+from contextlib import contextmanager
+
+from prometheus_client import CollectorRegistry, Histogram, CONTENT_TYPE_LATEST, REGISTRY, generate_latest
+from prometheus_client import multiprocess
+
+CONTENT_TYPE = CONTENT_TYPE_LATEST
+
+STAGE_SECONDS = Histogram(
+    "accidents_stage_seconds", "Duration of a processing stage of a data request",
+    ["page", "stage", "year", "class_type"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+PAYLOAD_BYTES = Histogram(
+    "accidents_payload_bytes", "Size of the serialized Dash callback response",
+    ["page", "output", "year", "class_type"],
+    buckets=(1e3, 1e4, 5e4, 1e5, 5e5, 1e6, 5e6, 1e7, 5e7),
+)
+
+
+@contextmanager
+def timed(page, stage, year="", class_type=""):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(page, stage, str(year), str(class_type)).observe(time.perf_counter() - start)
+
+
+def render() -> bytes:
+    # with several worker processes every worker writes to PROMETHEUS_MULTIPROC_DIR and the route aggregates
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def clear_multiprocess_dir():
+    # the files of earlier runs would be summed into the new ones, cleared before the workers are started
+    directory = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if not directory:
+        return
+    os.makedirs(directory, exist_ok=True)
+    for name in os.listdir(directory):
+        if name.endswith(".db"):
+            os.remove(os.path.join(directory, name))
+
+
+def mark_process_dead(pid):
+    # drops the live gauge files of a worker that exited, its counters and histograms are kept
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
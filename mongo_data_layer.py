@@ -1,14 +1,71 @@
 import os
+import threading
+
 import pymongo
 
+# the loader tools append a document with a new Timestamp here whenever the accident data changes
+VERSION_COLLECTION = "unfaelle-schweiz-versions"
+
+# accidentStat key of the per-year chart counts document in the stats collection
+MAP_COUNTS_STAT = "mapCounts"
+
+# flat columns used by the map page and its filters, projected server side from the GeoJSON feature documents
+ACCIDENT_FIELDS = {
+    "lat": {"$arrayElemAt": ["$geometry.coordinates", 1]},
+    "lon": {"$arrayElemAt": ["$geometry.coordinates", 0]},
+    "AccidentType_de": "$properties.AccidentType_de",
+    "AccidentSeverityCategory_de": "$properties.AccidentSeverityCategory_de",
+    "AccidentInvolvingBicycle": "$properties.AccidentInvolvingBicycle",
+    "AccidentInvolvingPedestrian": "$properties.AccidentInvolvingPedestrian",
+    "RoadType_de": "$properties.RoadType_de",
+    "CantonCode": "$properties.CantonCode",
+}
+
+
+# pymongo clients shared by all collection wrappers of the process, one connection pool per uri
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def client_options() -> dict:
+    return dict(
+        maxPoolSize=int(os.getenv("MONGODB_MAX_POOL_SIZE", "50")),
+        minPoolSize=int(os.getenv("MONGODB_MIN_POOL_SIZE", "0")),
+        maxIdleTimeMS=int(os.getenv("MONGODB_MAX_IDLE_TIME_MS", "300000")),
+        serverSelectionTimeoutMS=int(os.getenv("MONGODB_SERVER_SELECTION_TIMEOUT_MS", "5000")),
+        connectTimeoutMS=int(os.getenv("MONGODB_CONNECT_TIMEOUT_MS", "5000")),
+        socketTimeoutMS=int(os.getenv("MONGODB_SOCKET_TIMEOUT_MS", "120000")),
+        readPreference=os.getenv("MONGODB_READ_PREFERENCE", "primaryPreferred"),
+        # compressors whose package is not installed are skipped by pymongo with a warning
+        compressors=os.getenv("MONGODB_COMPRESSORS", "zstd,snappy,zlib"),
+        retryReads=True,
+        retryWrites=True,
+    )
+
+
+def get_client() -> pymongo.MongoClient:
+    db_pass = os.getenv("MONGODB_PASS")
+    db_user = os.getenv("MONGODB_USER")
+    db_url = os.getenv("MONGODB_URL")
+    uri = f"mongodb://{db_user}:{db_pass}@{db_url}"
+    with _clients_lock:
+        client = _clients.get(uri)
+        if client is None:
+            client = pymongo.MongoClient(uri, **client_options())
+            _clients[uri] = client
+    return client
+
+
+def close_clients():
+    with _clients_lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
 
 class MongoClient():
     def __init__(self, collection):
-        db_pass = os.getenv("MONGODB_PASS")
-        db_user = os.getenv("MONGODB_USER")
-        db_url = os.getenv("MONGODB_URL")
-        uri = f"mongodb://{db_user}:{db_pass}@{db_url}"
-        client = pymongo.MongoClient(uri)
+        client = get_client()
         db = client.myDatabase
         self.my_collection = db[collection]
 
@@ -20,6 +77,18 @@ class MongoClient():
         else:
             return result
 
+    def bulk_write(self, requests, ordered=False) -> pymongo.results.BulkWriteResult:
+        # write errors are raised, the loader tools must not publish a data version after a failed batch
+        return self.my_collection.bulk_write(requests, ordered=ordered)
+
+    def replace_document(self, key, value, document) -> pymongo.results.UpdateResult:
+        # atomic swap of a single document, inserted if it does not exist yet
+        # errors are raised like in bulk_write, no data version is published over a failed stats write
+        return self.my_collection.replace_one({key: value}, document, upsert=True)
+
+    def create_unique_index(self, key) -> str:
+        return self.my_collection.create_index([(key, pymongo.ASCENDING)], unique=True)
+
     def get_most_recent_doc_from_collection(self) -> pymongo.CursorType:
         return self.my_collection.find().sort("Timestamp", -1).limit(1)
 
@@ -29,6 +98,37 @@ class MongoClient():
     def get_docs_from_collection(self, key, value) -> pymongo.CursorType:
         return self.my_collection.find({key: value})
 
+    def get_projected_docs(self, fields: dict, query: dict = None, limit: int = None,
+                           batch_size: int = 10000) -> pymongo.command_cursor.CommandCursor:
+        # $project flattens the nested documents in the database, so only the requested fields are transferred
+        pipeline = []
+        if query:
+            pipeline.append({"$match": query})
+        if limit:
+            pipeline.append({"$limit": limit})
+        pipeline.append({"$project": {"_id": 0, **fields}})
+        return self.my_collection.aggregate(pipeline, batchSize=batch_size)
+
+    def get_projected_docs_within_box(self, fields: dict, bounds, query: dict = None,
+                                      limit: int = None) -> pymongo.command_cursor.CommandCursor:
+        # bounds are (west, south, east, north) in degrees, served by the 2dsphere index on geometry
+        west, south, east, north = bounds
+        ring = [[west, south], [east, south], [east, north], [west, north], [west, south]]
+        box_query = {"geometry": {"$geoWithin": {"$geometry": {"type": "Polygon", "coordinates": [ring]}}}}
+        if query:
+            box_query.update(query)
+        return self.get_projected_docs(fields, box_query, limit=limit)
+
+    def create_geo_index(self) -> str:
+        # year second so that viewport queries for a single year are answered from the same index
+        return self.my_collection.create_index([("geometry", pymongo.GEOSPHERE), ("properties.AccidentYear", pymongo.ASCENDING)])
+
+    def get_docs_with_values(self, key, values, projection: dict = None) -> pymongo.CursorType:
+        return self.my_collection.find({key: {"$in": list(values)}}, projection)
+
+    def aggregate(self, pipeline) -> pymongo.command_cursor.CommandCursor:
+        return self.my_collection.aggregate(pipeline, allowDiskUse=True)
+
     def get_single_doc_from_collection(self, key, value) -> pymongo.CursorType:
         return self.my_collection.find_one({key: value})
 
@@ -50,4 +150,5 @@ if "__main__" == __name__:
     print(list(cursor))
     docs = client.get_docs_from_collection("properties.AccidentYear", "2022")
     print(list(docs.limit(1000)))
+    print(list(client.get_projected_docs(ACCIDENT_FIELDS, {"properties.AccidentYear": "2022"}, limit=10)))
 
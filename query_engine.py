@@ -0,0 +1,100 @@
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from accident_decoder import concat_frames
+
+# columns the map page can filter on, categorical labels and boolean involvement flags
+FILTER_COLUMNS = ["AccidentSeverityCategory_de", "AccidentType_de", "RoadType_de", "CantonCode",
+                  "AccidentInvolvingBicycle", "AccidentInvolvingPedestrian"]
+# key of a list of sub-filters of which at least one has to match
+ANY = "any"
+
+
+class AccidentIndex():
+    # Boolean array per value of the filter columns of one decoded year frame, built on first use of a column.
+    # A filter is answered with bitwise operations on these arrays, without scanning the labels again.
+    # on_build is called after the arrays of a column were added, e.g. to account for their memory.
+    def __init__(self, df: pd.DataFrame, on_build=None):
+        self.df = df
+        self.on_build = on_build
+        self._bitmaps = {}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bitmap.nbytes for bitmaps in list(self._bitmaps.values()) for bitmap in bitmaps.values())
+
+    def bitmaps(self, column) -> dict:
+        bitmaps = self._bitmaps.get(column)
+        if bitmaps is None:
+            values = self.df[column]
+            if values.dtype == bool:
+                flags = values.to_numpy()
+                bitmaps = {True: flags, False: ~flags}
+            else:
+                codes = values.cat.codes.to_numpy()
+                bitmaps = {label: codes == i for i, label in enumerate(values.cat.categories)}
+            self._bitmaps[column] = bitmaps
+            if self.on_build is not None:
+                self.on_build()
+        return bitmaps
+
+    def match(self, filters: dict) -> np.ndarray:
+        # AND over the columns, OR over the values of a column, columns without values do not filter
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, values in filters.items():
+            if column == ANY:
+                if values:
+                    mask &= np.logical_or.reduce([self.match(f) for f in values])
+            elif values:
+                selected = np.zeros(len(self.df), dtype=bool)
+                bitmaps = self.bitmaps(column) if column in self.df else {}
+                for value in values:
+                    bitmap = bitmaps.get(value)
+                    if bitmap is not None:
+                        selected |= bitmap
+                mask &= selected
+        return mask
+
+    def counts(self, mask, column) -> Counter:
+        values = self.df[column]
+        if values.dtype == bool:
+            flags = values.to_numpy()[mask]
+            n = int(flags.sum())
+            return Counter({"true": n, "false": len(flags) - n})
+        counts = np.bincount(values.cat.codes.to_numpy()[mask], minlength=len(values.cat.categories))
+        return Counter({str(label): int(n) for label, n in zip(values.cat.categories, counts) if n})
+
+
+def box_mask(df, bounds) -> np.ndarray:
+    west, south, east, north = bounds
+    lon = df['lon'].to_numpy()
+    lat = df['lat'].to_numpy()
+    return (lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)
+
+
+def select(indexes, filters: dict, bounds=None, limit=None) -> pd.DataFrame:
+    # matching accidents of several years, optionally within (west, south, east, north) and capped at limit rows
+    parts = []
+    remaining = limit
+    for index in indexes:
+        mask = index.match(filters)
+        if bounds is not None:
+            mask &= box_mask(index.df, bounds)
+        rows = mask.nonzero()[0]
+        if remaining is not None:
+            rows = rows[:remaining]
+            remaining -= len(rows)
+        parts.append(index.df.iloc[rows])
+        if remaining == 0:
+            break
+    return concat_frames(parts)
+
+
+def count(indexes, filters: dict, column) -> dict:
+    # grouped counts of the matching accidents in the same shape as the precomputed chart counts
+    total = Counter()
+    for index in indexes:
+        total.update(index.counts(index.match(filters), column))
+    return dict(total.most_common())
@@ -0,0 +1,38 @@
+import os
+import time
+
+from data_source import create_data_source, YEARS
+from mongo_data_layer import close_clients
+from snapshot_source import snapshot_path, frame_to_table, write_table, write_metadata, write_cube
+
+# tmpfs by default, so the snapshot lives in shared memory and every worker maps the same pages
+SHARED_DIR = os.getenv("ACCIDENT_SHARED_DIR", "/dev/shm/swiss-accidents")
+STATS = ["allYearly", "bikesYearly", "pedestrianYearly"]
+
+
+def preload_shared_snapshot(directory=SHARED_DIR):
+    # Decodes the dataset once from the configured data source into an Arrow snapshot and points all workers
+    # started afterwards at it. Must run in the parent process before the workers are spawned or forked.
+    # The snapshot is frozen: data versions published later by the loader tools are only served after a restart.
+    init = time.time()
+    source = create_data_source()
+    os.makedirs(directory, exist_ok=True)
+    for year in YEARS:
+        write_table(frame_to_table(source.load_year(year)), snapshot_path(directory, year))
+
+    counts_list = list(source.load_counts().values())
+    stats = {}
+    for stat in STATS:
+        doc = source.get_stats(stat)
+        if doc is not None:
+            stats[stat] = {k: v for k, v in doc.items() if k != "_id"}
+    cube = source.load_cube()
+    if cube is not None:
+        write_cube(directory, cube)
+    write_metadata(directory, counts_list, stats, source.get_version(), YEARS)
+    print(f"Preloaded shared accident snapshot into {directory} in {time.time() - init:.2f} seconds")
+    # the workers never use the parent's connections, and pymongo clients must not be shared across forks
+    close_clients()
+
+    os.environ["ACCIDENT_DATA_SOURCE"] = "snapshot"
+    os.environ["ACCIDENT_SNAPSHOT_DIR"] = directory
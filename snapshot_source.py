@@ -0,0 +1,87 @@
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from accident_decoder import decode_frame, COLUMNS
+from data_source import AccidentDataSource
+from temporal_cube import TemporalCube
+
+MANIFEST_FILE = "manifest.json"
+COUNTS_FILE = "counts.json"
+STATS_FILE = "stats.json"
+CUBE_FILE = "cube.npz"
+
+
+def snapshot_path(directory, year) -> str:
+    return os.path.join(directory, f"accidents_{year}.arrow")
+
+
+def frame_to_table(df) -> pa.Table:
+    # same columns and types as the decoded MongoDB frames, categorical labels become dictionary arrays
+    return pa.Table.from_pandas(decode_frame(df[COLUMNS]), preserve_index=False)
+
+
+def write_table(table, path):
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+
+
+def write_cube(directory, cube: TemporalCube):
+    with open(os.path.join(directory, CUBE_FILE), 'wb') as file:
+        file.write(cube.to_bytes())
+
+
+def write_metadata(directory, counts_list, stats: dict, version, years):
+    with open(os.path.join(directory, COUNTS_FILE), 'w') as file:
+        json.dump(counts_list, file)
+    with open(os.path.join(directory, STATS_FILE), 'w') as file:
+        json.dump(stats, file)
+    # the manifest is written last, its timestamp is the data version seen by the app
+    with open(os.path.join(directory, MANIFEST_FILE), 'w') as file:
+        json.dump({"Timestamp": str(version), "years": [str(y) for y in years]}, file)
+
+
+class LocalSnapshotSource(AccidentDataSource):
+    # Reads the year partitioned Arrow IPC snapshot written by data_tools/export_snapshot.py.
+    # Files are memory-mapped, so nothing is parsed and pages are only read from disk when touched.
+    def __init__(self, directory):
+        self.directory = directory
+        self._stats = None
+
+    def load_year(self, year) -> pd.DataFrame:
+        source = pa.memory_map(snapshot_path(self.directory, year), 'r')
+        table = pa.ipc.open_file(source).read_all()
+        # dictionary encoded columns become pandas categoricals, split blocks let the float32 coordinates
+        # reference the mapped pages instead of being copied into one consolidated block
+        return table.to_pandas(split_blocks=True)
+
+    def get_version(self):
+        with open(os.path.join(self.directory, MANIFEST_FILE), 'r') as file:
+            return json.load(file)["Timestamp"]
+
+    def load_counts(self) -> dict:
+        path = os.path.join(self.directory, COUNTS_FILE)
+        if not os.path.exists(path):
+            return {}
+        with open(path, 'r') as file:
+            return {str(stats["year"]): stats for stats in json.load(file)}
+
+    def get_stats(self, stat):
+        if self._stats is None:
+            path = os.path.join(self.directory, STATS_FILE)
+            if os.path.exists(path):
+                with open(path, 'r') as file:
+                    self._stats = json.load(file)
+            else:
+                self._stats = {}
+        return self._stats.get(stat)
+
+    def load_cube(self) -> TemporalCube:
+        path = os.path.join(self.directory, CUBE_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as file:
+            return TemporalCube.from_bytes(file.read())
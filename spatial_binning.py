@@ -0,0 +1,44 @@
+import math
+
+import numpy as np
+
+# size of a grid cell on screen, the cell size in degrees follows from the zoom level
+CELL_PIXELS = 16
+
+
+def cell_size_for_zoom(zoom: float) -> float:
+    # degrees of longitude covered by CELL_PIXELS at a web mercator zoom level (256 px tiles)
+    return 360.0 / (2 ** zoom) * CELL_PIXELS / 256
+
+
+def bin_points(lat, lon, codes, n_categories: int, cell_deg: float) -> dict:
+    # Bins points into a square grid and counts the points of every category per cell.
+    # codes are integer category codes (e.g. pandas categorical codes), negative codes are skipped.
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    codes = np.asarray(codes, dtype=np.int64)
+    valid = np.isfinite(lat) & np.isfinite(lon) & (codes >= 0)
+    lat, lon, codes = lat[valid], lon[valid], codes[valid]
+    if len(lat) == 0:
+        return dict(lat=np.empty(0), lon=np.empty(0), count=np.empty(0, dtype=np.int64),
+                    category_counts=np.empty((0, n_categories), dtype=np.int64))
+
+    # cells are square on screen, so they are shorter in latitude by the mercator scale factor
+    lat_cell = cell_deg * math.cos(math.radians(float(lat.mean())))
+    ix = np.floor(lon / cell_deg).astype(np.int64)
+    iy = np.floor(lat / lat_cell).astype(np.int64)
+    ix -= ix.min()
+    iy -= iy.min()
+    keys = ix * (int(iy.max()) + 1) + iy
+
+    cells, inverse = np.unique(keys, return_inverse=True)
+    n_cells = len(cells)
+    count = np.bincount(inverse, minlength=n_cells)
+    category_counts = np.bincount(inverse * n_categories + codes,
+                                  minlength=n_cells * n_categories).reshape(n_cells, n_categories)
+
+    # place markers at the centroid of their points rather than the cell centre
+    return dict(lat=np.bincount(inverse, weights=lat, minlength=n_cells) / count,
+                lon=np.bincount(inverse, weights=lon, minlength=n_cells) / count,
+                count=count,
+                category_counts=category_counts)
@@ -0,0 +1,170 @@
+import math
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from accident_decoder import concat_frames
+
+EARTH_RADIUS = 6371008.8
+# centre of the equirectangular projection, distances within Switzerland are off by well under 1%
+ORIGIN_LAT = 46.8
+_X_SCALE = EARTH_RADIUS * math.cos(math.radians(ORIGIN_LAT))
+CELL_METERS = 250
+# the largest radius searched by nearest, more than the extent of the country
+MAX_SEARCH_METERS = 500000
+# hotspots are the densest 3 x 3 blocks of cells of this size
+HOTSPOT_CELL_METERS = 200
+HOTSPOTS = 20
+SEVERITY_COLUMN = "AccidentSeverityCategory_de"
+
+_KEY_OFFSET = 2 ** 20
+_KEY_STRIDE = 2 ** 21
+
+
+def project(lon, lat) -> tuple:
+    # metres east and north of the equator and the prime meridian
+    return np.radians(lon) * _X_SCALE, np.radians(lat) * EARTH_RADIUS
+
+
+def unproject(x, y) -> tuple:
+    return np.degrees(x / _X_SCALE), np.degrees(y / EARTH_RADIUS)
+
+
+def cell_keys(cx, cy):
+    # cells of one column are consecutive keys, so a column range is a single slice of the sorted keys
+    return cx * _KEY_STRIDE + (cy + _KEY_OFFSET)
+
+
+def find_hotspots(x, y, codes, labels, n=HOTSPOTS, cell=HOTSPOT_CELL_METERS) -> list:
+    # Density peaks: every cell is scored with the accidents of its 3 x 3 neighbourhood, the best blocks are taken
+    # greedily, skipping blocks that overlap one already taken.
+    if len(x) == 0:
+        return []
+    cx = np.floor(x / cell).astype(np.int64)
+    cy = np.floor(y / cell).astype(np.int64)
+    keys, counts = np.unique(cell_keys(cx, cy), return_counts=True)
+    key_cx = keys // _KEY_STRIDE
+    key_cy = keys % _KEY_STRIDE - _KEY_OFFSET
+    density = np.zeros(len(keys), dtype=np.int64)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            neighbours = cell_keys(key_cx + dx, key_cy + dy)
+            found = np.searchsorted(keys, neighbours).clip(max=len(keys) - 1)
+            density += np.where(keys[found] == neighbours, counts[found], 0)
+
+    hotspots = []
+    taken = []
+    for i in np.argsort(-density, kind="stable"):
+        if len(hotspots) == n:
+            break
+        if any(abs(key_cx[i] - tx) <= 2 and abs(key_cy[i] - ty) <= 2 for tx, ty in taken):
+            continue
+        taken.append((key_cx[i], key_cy[i]))
+        inside = (np.abs(cx - key_cx[i]) <= 1) & (np.abs(cy - key_cy[i]) <= 1)
+        lon, lat = unproject(x[inside].mean(), y[inside].mean())
+        severities = np.bincount(codes[inside][codes[inside] >= 0], minlength=len(labels))
+        hotspots.append({"lat": float(lat), "lon": float(lon), "count": int(density[i]),
+                         "radius_m": 1.5 * cell * math.sqrt(2),
+                         "severities": {str(label): int(c) for label, c in zip(labels, severities) if c}})
+    return hotspots
+
+
+class SpatialIndex():
+    # Grid hash over the projected coordinates of one decoded year frame. The points are sorted by cell, so the
+    # points of a column of cells are one contiguous slice found with a binary search.
+    # The hotspot ranking of every severity is computed once when the index is built.
+    def __init__(self, df: pd.DataFrame, cell=CELL_METERS):
+        self.df = df
+        self.cell = cell
+        lon = df['lon'].to_numpy(np.float64)
+        lat = df['lat'].to_numpy(np.float64)
+        rows = (np.isfinite(lon) & np.isfinite(lat)).nonzero()[0]
+        x, y = project(lon[rows], lat[rows])
+        keys = cell_keys(np.floor(x / cell).astype(np.int64), np.floor(y / cell).astype(np.int64))
+        order = np.argsort(keys, kind="stable")
+        self.rows, self.x, self.y, self.keys = rows[order], x[order], y[order], keys[order]
+
+        severities = df[SEVERITY_COLUMN]
+        self.labels = list(severities.cat.categories)
+        self.codes = severities.cat.codes.to_numpy()[self.rows]
+        self.hotspots = {None: find_hotspots(self.x, self.y, self.codes, self.labels)}
+        for code, label in enumerate(self.labels):
+            selected = self.codes == code
+            self.hotspots[label] = find_hotspots(self.x[selected], self.y[selected], self.codes[selected],
+                                                 self.labels)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in (self.rows, self.x, self.y, self.keys, self.codes))
+
+    def within(self, lon, lat, radius) -> tuple:
+        # frame rows within radius metres of (lon, lat) and their distances, nearest first
+        qx, qy = project(lon, lat)
+        columns = np.arange(math.floor((qx - radius) / self.cell), math.floor((qx + radius) / self.cell) + 1)
+        low = np.searchsorted(self.keys, cell_keys(columns, math.floor((qy - radius) / self.cell)), 'left')
+        high = np.searchsorted(self.keys, cell_keys(columns, math.floor((qy + radius) / self.cell)), 'right')
+        if (high > low).any():
+            candidates = np.concatenate([np.arange(lo, hi) for lo, hi in zip(low, high) if hi > lo])
+        else:
+            candidates = np.empty(0, dtype=np.int64)
+        distances = np.hypot(self.x[candidates] - qx, self.y[candidates] - qy)
+        inside = distances <= radius
+        candidates, distances = candidates[inside], distances[inside]
+        order = np.argsort(distances, kind="stable")
+        return self.rows[candidates[order]], distances[order]
+
+    def nearest(self, lon, lat, k) -> tuple:
+        # rings of doubling radius until k points are found, the k nearest are always inside the last ring
+        radius = self.cell
+        while True:
+            rows, distances = self.within(lon, lat, radius)
+            if len(rows) >= k or radius >= MAX_SEARCH_METERS:
+                return rows[:k], distances[:k]
+            radius *= 2
+
+
+def _frame(indexes, rows, distances, limit) -> pd.DataFrame:
+    # accidents of several years with their distance, nearest first
+    parts = [index.df.iloc[r] for index, r in zip(indexes, rows) if len(r)] or [indexes[0].df.iloc[:0]]
+    df = concat_frames(parts)
+    df["distance_m"] = np.concatenate(distances)
+    return df.sort_values("distance_m", kind="stable").head(limit).reset_index(drop=True)
+
+
+def within(indexes, lon, lat, radius, limit=None) -> pd.DataFrame:
+    results = [index.within(lon, lat, radius) for index in indexes]
+    return _frame(indexes, [r for r, _ in results], [d for _, d in results], limit)
+
+
+def count_within(indexes, lon, lat, radius, column) -> dict:
+    # label counts of the accidents within radius metres, without assembling their rows
+    total = Counter()
+    for index in indexes:
+        rows, _ = index.within(lon, lat, radius)
+        values = index.df[column]
+        codes = values.cat.codes.to_numpy()[rows]
+        counts = np.bincount(codes[codes >= 0], minlength=len(values.cat.categories))
+        total.update({str(label): int(n) for label, n in zip(values.cat.categories, counts) if n})
+    return dict(total.most_common())
+
+
+def nearest(indexes, lon, lat, k) -> pd.DataFrame:
+    results = [index.nearest(lon, lat, k) for index in indexes]
+    return _frame(indexes, [r for r, _ in results], [d for _, d in results], k)
+
+
+def hotspots(indexes, severity=None, n=HOTSPOTS) -> list:
+    # a single year is answered from the precomputed ranking, several years are ranked on their combined points
+    if len(indexes) == 1:
+        return indexes[0].hotspots.get(severity, [])[:n]
+    labels = sorted({label for index in indexes for label in index.labels})
+    x, y, codes = [], [], []
+    for index in indexes:
+        recode = np.array([labels.index(label) for label in index.labels] + [-1])
+        selected = slice(None) if severity is None else index.codes == (
+            index.labels.index(severity) if severity in index.labels else -2)
+        x.append(index.x[selected])
+        y.append(index.y[selected])
+        codes.append(recode[index.codes[selected]])
+    return find_hotspots(np.concatenate(x), np.concatenate(y), np.concatenate(codes), labels, n)
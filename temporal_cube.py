@@ -0,0 +1,88 @@
+import io
+import json
+
+import numpy as np
+import pandas as pd
+
+# accidentStat key of the cube document in the stats collection
+CUBE_STAT = "temporalCube"
+
+DIMENSIONS = ["AccidentYear", "AccidentMonth", "AccidentWeekDay", "AccidentHour", "AccidentSeverityCategory_de",
+              "AccidentType_de"]
+
+# labels of the fixed dimensions as they appear in the FEDRO records, weekdays aw401 (Monday) to aw407 (Sunday)
+FIXED_LABELS = {
+    "AccidentMonth": [str(m) for m in range(1, 13)],
+    "AccidentWeekDay": [f"aw40{d}" for d in range(1, 8)],
+    "AccidentHour": [f"{h:02d}" for h in range(24)],
+    "AccidentSeverityCategory_de": ["Unfall mit Leichtverletzten", "Unfall mit Schwerverletzten",
+                                    "Unfall mit Getöteten"],
+}
+
+
+def group_cube_rows(df) -> pd.DataFrame:
+    # accident counts per combination of the cube dimensions, for frames with the raw record properties
+    return df.groupby(DIMENSIONS, dropna=True, observed=True).size().reset_index(name="count")
+
+
+class TemporalCube():
+    # Dense accident counts over DIMENSIONS, one axis per dimension in that order.
+    # Roll-ups select labels on some axes and sum over all axes that are not kept, results are memoized.
+    # Stored with the smallest integer type that fits, held as int64 in memory so sums need no conversion.
+    def __init__(self, counts: np.ndarray, labels: dict):
+        self.counts = counts.astype(np.int64, copy=False)
+        self.labels = labels
+        self._rollups = {}
+
+    @classmethod
+    def from_grouped(cls, grouped: pd.DataFrame):
+        labels = {}
+        for dim in DIMENSIONS:
+            labels[dim] = FIXED_LABELS.get(dim) or sorted(str(x) for x in grouped[dim].dropna().unique())
+        codes = [pd.Categorical(grouped[dim].astype(str), categories=labels[dim]).codes for dim in DIMENSIONS]
+        # records with a label outside the fixed dimensions (e.g. an unknown hour) are not part of the cube
+        known = np.logical_and.reduce([c >= 0 for c in codes])
+        if not known.all():
+            print(f"Skipped {int(grouped['count'][~known].sum())} accidents with unknown time or severity")
+        counts = np.zeros([len(labels[dim]) for dim in DIMENSIONS], dtype=np.int64)
+        np.add.at(counts, tuple(c[known] for c in codes), grouped["count"].to_numpy()[known])
+        return cls(counts, labels)
+
+    def to_bytes(self) -> bytes:
+        buffer = io.BytesIO()
+        counts = self.counts.astype(np.min_scalar_type(int(self.counts.max(initial=0))))
+        np.savez_compressed(buffer, counts=counts, labels=np.array(json.dumps(self.labels)))
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data: bytes):
+        with np.load(io.BytesIO(data), allow_pickle=False) as npz:
+            return cls(npz["counts"], json.loads(str(npz["labels"])))
+
+    def rollup(self, keep=(), **where) -> np.ndarray:
+        # counts over the kept dimensions (in the given order), where selects labels, e.g. AccidentYear=["2023"]
+        key = (tuple(keep), tuple(sorted((dim, tuple(values)) for dim, values in where.items())))
+        result = self._rollups.get(key)
+        if result is None:
+            counts = self.counts
+            for dim, values in where.items():
+                axis = DIMENSIONS.index(dim)
+                positions = {label: i for i, label in enumerate(self.labels[dim])}
+                counts = counts.take([positions[str(v)] for v in values if str(v) in positions], axis=axis)
+            # one axis at a time from the outermost, each step adds up large contiguous blocks
+            axes = [i for i, dim in enumerate(DIMENSIONS) if dim not in keep]
+            for removed, axis in enumerate(axes):
+                counts = counts.sum(axis=axis - removed)
+            result = np.asarray(counts)
+            # the kept axes are in cube order, transpose them into the requested order
+            kept = [dim for dim in DIMENSIONS if dim in keep]
+            result = result.transpose([kept.index(dim) for dim in keep])
+            result.flags.writeable = False
+            self._rollups[key] = result
+        return result
+
+    def rollup_frame(self, keep, **where) -> pd.DataFrame:
+        # long format of a roll-up with one column per kept dimension and a count column
+        counts = self.rollup(keep, **where)
+        index = pd.MultiIndex.from_product([self.labels[dim] for dim in keep], names=list(keep))
+        return pd.DataFrame({"count": counts.ravel()}, index=index).reset_index()
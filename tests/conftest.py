@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from accident_decoder import decode_frame
+from temporal_cube import FIXED_LABELS
+
+TYPES = ["Schleuder- oder Selbstunfall", "Auffahrunfall", "Abbiegeunfall", "Fussgängerunfall", "andere"]
+SEVERITIES = FIXED_LABELS["AccidentSeverityCategory_de"]
+ROADS = ["Hauptstrasse", "Nebenstrasse", "Autobahn"]
+CANTONS = ["ZH", "BE", "GE", "TI"]
+# a few dense towns on top of accidents spread over the whole country
+TOWNS = [(8.54, 47.37), (7.45, 46.95), (6.14, 46.2)]
+
+
+def accident_frame(year, n, rng) -> pd.DataFrame:
+    town = rng.integers(0, len(TOWNS) + 1, n)
+    centres = np.array(TOWNS + [(8.2, 46.8)])[town]
+    spread = np.where(town < len(TOWNS), 0.02, 1.0)[:, None]
+    position = centres + rng.normal(0, 1, (n, 2)) * spread
+    return decode_frame(pd.DataFrame({
+        "lat": position[:, 1],
+        "lon": position[:, 0],
+        "AccidentType_de": rng.choice(TYPES, n),
+        "AccidentSeverityCategory_de": rng.choice(SEVERITIES, n, p=[0.8, 0.18, 0.02]),
+        "AccidentInvolvingBicycle": rng.choice(["true", "false"], n, p=[0.2, 0.8]),
+        "AccidentInvolvingPedestrian": rng.choice(["true", "false"], n, p=[0.1, 0.9]),
+        "RoadType_de": rng.choice(ROADS, n),
+        "CantonCode": rng.choice(CANTONS, n),
+        "AccidentYear": str(year),
+        "AccidentMonth": rng.choice(FIXED_LABELS["AccidentMonth"], n),
+        "AccidentWeekDay": rng.choice(FIXED_LABELS["AccidentWeekDay"], n),
+        "AccidentHour": rng.choice(FIXED_LABELS["AccidentHour"], n),
+    }))
+
+
+@pytest.fixture
+def make_frame():
+    return accident_frame
+
+
+@pytest.fixture
+def frames():
+    rng = np.random.default_rng(7)
+    return {year: accident_frame(year, 3000, rng) for year in ["2021", "2022", "2023"]}
@@ -0,0 +1,27 @@
+import numpy as np
+import pandas as pd
+
+from data_tools.build_stats import group_frame, build_stat_documents
+
+
+def grouped(frames) -> pd.DataFrame:
+    return pd.concat([group_frame(df) for df in frames.values()], ignore_index=True)
+
+
+def test_partial_rebuild_matches_full_rebuild(frames, make_frame):
+    existing = build_stat_documents(grouped(frames))
+    changed = dict(frames, **{"2022": make_frame("2022", 1000, np.random.default_rng(1))})
+
+    full = build_stat_documents(grouped(changed))
+    partial = build_stat_documents(group_frame(changed["2022"]), existing, ["2022"])
+
+    assert partial == full
+
+
+def test_map_counts_add_up(frames):
+    documents = build_stat_documents(grouped(frames))
+    stats = {stats["year"]: stats for stats in documents["mapCounts"]["data"]}
+
+    assert sorted(stats) == ["2021", "2022", "2023", "all"]
+    assert sum(stats["all"]["types"].values()) == sum(len(df) for df in frames.values())
+    assert stats["2023"]["bikes"]["true"] == int(frames["2023"]["AccidentInvolvingBicycle"].sum())
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+import query_engine
+from query_engine import AccidentIndex, ANY
+
+FILTERS = [
+    {},
+    {"AccidentSeverityCategory_de": ["Unfall mit Schwerverletzten", "Unfall mit Getöteten"]},
+    {"AccidentType_de": ["Auffahrunfall"], "CantonCode": ["ZH", "BE"], "RoadType_de": []},
+    {"AccidentInvolvingBicycle": [True], "AccidentSeverityCategory_de": ["Unfall mit Leichtverletzten"]},
+    {"CantonCode": ["ZH"], ANY: [{"AccidentInvolvingBicycle": [True]}, {"AccidentInvolvingPedestrian": [True]}]},
+    {"CantonCode": ["XX"]},
+]
+
+
+def pandas_mask(df, filters) -> np.ndarray:
+    mask = pd.Series(True, index=df.index)
+    for column, values in filters.items():
+        if column == ANY:
+            if values:
+                mask &= np.logical_or.reduce([pandas_mask(df, f) for f in values])
+        elif values:
+            mask &= df[column].isin(values)
+    return mask.to_numpy()
+
+
+def test_match_equals_pandas(frames):
+    df = frames["2023"]
+    index = AccidentIndex(df)
+    for filters in FILTERS:
+        assert (index.match(filters) == pandas_mask(df, filters)).all(), filters
+
+
+def test_select_and_count_over_years(frames):
+    indexes = [AccidentIndex(df) for df in frames.values()]
+    filters = FILTERS[2]
+    bounds = (8.3, 47.2, 8.7, 47.5)
+    expected = pd.concat([df[pandas_mask(df, filters)] for df in frames.values()], ignore_index=True)
+
+    counts = query_engine.count(indexes, filters, "RoadType_de")
+    assert counts == {str(k): int(v) for k, v in expected["RoadType_de"].value_counts().items() if v}
+
+    inside = expected[expected["lon"].between(8.3, 8.7) & expected["lat"].between(47.2, 47.5)]
+    selected = query_engine.select(indexes, filters, bounds)
+    assert len(selected) == len(inside) > 0
+    assert len(query_engine.select(indexes, filters, bounds, limit=5)) == 5
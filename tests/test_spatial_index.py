@@ -0,0 +1,64 @@
+import numpy as np
+
+import spatial_index
+from spatial_index import SpatialIndex, project
+
+POINTS = [(8.54, 47.37), (7.45, 46.95), (8.2, 46.8), (6.0, 45.9)]
+
+
+def distances(df, lon, lat) -> np.ndarray:
+    x, y = project(df["lon"].to_numpy(np.float64), df["lat"].to_numpy(np.float64))
+    qx, qy = project(lon, lat)
+    return np.hypot(x - qx, y - qy)
+
+
+def test_within_equals_brute_force(frames):
+    df = frames["2023"]
+    index = SpatialIndex(df)
+    for lon, lat in POINTS:
+        brute = distances(df, lon, lat)
+        for radius in (100, 500, 2000, 20000):
+            rows, found = index.within(lon, lat, radius)
+            assert sorted(rows) == sorted((brute <= radius).nonzero()[0])
+            assert np.allclose(found, brute[rows])
+            assert (np.diff(found) >= 0).all()
+
+
+def test_nearest_equals_brute_force(frames):
+    df = frames["2022"]
+    index = SpatialIndex(df)
+    for lon, lat in POINTS:
+        brute = np.sort(distances(df, lon, lat))
+        for k in (1, 10, 100):
+            rows, found = index.nearest(lon, lat, k)
+            assert np.allclose(found, brute[:k])
+
+
+def test_multi_year_queries(frames):
+    indexes = [SpatialIndex(df) for df in frames.values()]
+    lon, lat = POINTS[0]
+    expected = sum(int((distances(df, lon, lat) <= 500).sum()) for df in frames.values())
+
+    within = spatial_index.within(indexes, lon, lat, 500)
+    assert len(within) == expected
+    assert (np.diff(within["distance_m"]) >= 0).all()
+    counts = spatial_index.count_within(indexes, lon, lat, 500, "AccidentSeverityCategory_de")
+    assert sum(counts.values()) == expected
+
+    empty = spatial_index.within(indexes, 0.0, 0.0, 500)
+    assert len(empty) == 0 and "distance_m" in empty
+
+    nearest = spatial_index.nearest(indexes, lon, lat, 5)
+    brute = np.sort(np.concatenate([distances(df, lon, lat) for df in frames.values()]))
+    assert np.allclose(nearest["distance_m"], brute[:5])
+
+
+def test_hotspots_are_the_towns(frames):
+    hotspots = spatial_index.hotspots([SpatialIndex(df) for df in frames.values()], n=3)
+    assert len(hotspots) == 3
+    assert all(hotspots[i]["count"] >= hotspots[i + 1]["count"] for i in range(2))
+    # the synthetic accidents cluster around three towns, every hotspot lies in one of them
+    for hotspot in hotspots:
+        assert min(np.hypot(hotspot["lon"] - lon, hotspot["lat"] - lat) for lon, lat in
+                   [(8.54, 47.37), (7.45, 46.95), (6.14, 46.2)]) < 0.05
+        assert sum(hotspot["severities"].values()) == hotspot["count"]
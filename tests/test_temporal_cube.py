@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from data_tools.build_stats import build_cube
+from temporal_cube import TemporalCube, DIMENSIONS, group_cube_rows
+
+
+def cube_rows(frames) -> pd.DataFrame:
+    return pd.concat([group_cube_rows(df) for df in frames.values()], ignore_index=True)
+
+
+def test_rollup_equals_groupby(frames):
+    df = pd.concat(frames.values(), ignore_index=True)
+    cube = TemporalCube.from_grouped(cube_rows(frames))
+
+    heatmap = cube.rollup(["AccidentHour", "AccidentWeekDay"], AccidentYear=["2022", "2023"])
+    selected = df[df["AccidentYear"].isin(["2022", "2023"])]
+    expected = selected.groupby(["AccidentHour", "AccidentWeekDay"], observed=True).size()
+    for (hour, weekday), n in expected.items():
+        i = cube.labels["AccidentHour"].index(hour)
+        j = cube.labels["AccidentWeekDay"].index(weekday)
+        assert heatmap[i, j] == n
+    assert heatmap.sum() == len(selected)
+    assert cube.rollup([]) == len(df)
+
+
+def test_round_trip_and_partial_build(frames, make_frame):
+    cube = TemporalCube.from_grouped(cube_rows(frames))
+    assert (TemporalCube.from_bytes(cube.to_bytes()).counts == cube.counts).all()
+
+    changed = dict(frames, **{"2021": make_frame("2021", 500, np.random.default_rng(3))})
+    full = build_cube(cube_rows(changed))
+    partial = build_cube(group_cube_rows(changed["2021"]), cube, ["2021"])
+    assert partial.labels == full.labels
+    assert (partial.counts == full.counts).all()
+    assert full.counts.shape == tuple(len(full.labels[dim]) for dim in DIMENSIONS)
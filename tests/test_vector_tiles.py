@@ -0,0 +1,61 @@
+from collections import Counter, defaultdict
+
+import numpy as np
+import pytest
+
+import vector_tiles
+from vector_tiles import thin_points, tile_bounds, THIN_CELL, TILE_BUFFER
+
+
+def test_thin_points_keeps_dominant_class_and_total():
+    rng = np.random.default_rng(5)
+    n = 5000
+    codes = rng.integers(-1, 4, n).astype(np.int8)
+    tile_x = rng.integers(-TILE_BUFFER, 4096 + TILE_BUFFER, n)
+    tile_y = rng.integers(-TILE_BUFFER, 4096 + TILE_BUFFER, n)
+    thinned_codes, thinned_x, thinned_y, counts = thin_points(codes, tile_x, tile_y, 4)
+
+    cells = defaultdict(Counter)
+    for code, x, y in zip(codes, tile_x, tile_y):
+        cells[(x // THIN_CELL, y // THIN_CELL)][code] += 1
+    assert len(thinned_codes) == len(cells)
+    assert counts.sum() == n
+    for code, x, y, count in zip(thinned_codes, thinned_x, thinned_y, counts):
+        classes = cells[(x // THIN_CELL, y // THIN_CELL)]
+        assert count == sum(classes.values())
+        assert classes[code] == max(classes.values())
+
+
+def test_thin_points_keeps_cells_on_the_buffer_edges_apart():
+    # the last cell of one column and the first cell of the next one
+    tile_x = np.array([0, THIN_CELL])
+    tile_y = np.array([4096 + TILE_BUFFER, -TILE_BUFFER])
+    _, _, _, counts = thin_points(np.zeros(2, dtype=np.int8), tile_x, tile_y, 1)
+    assert counts.tolist() == [1, 1]
+
+
+def test_tile_holds_the_accidents_of_its_bounds(frames, monkeypatch):
+    mapbox_vector_tile = pytest.importorskip("mapbox_vector_tile")
+    pytest.importorskip("shapely")
+    df = frames["2023"]
+    # the tile around Zurich, with and without merging the points per cell
+    z, x, y = 10, 536, 358
+    west, south, east, north = tile_bounds(z, x, y, TILE_BUFFER)
+    inside = df["lon"].between(west, east) & df["lat"].between(south, north)
+
+    for zoom_detail, expected_points in [(z, int(inside.sum())), (z + 1, None)]:
+        monkeypatch.setattr(vector_tiles, "FULL_DETAIL_ZOOM", zoom_detail)
+        layers = mapbox_vector_tile.decode(vector_tiles.build_tile(df, "AccidentSeverityCategory_de", z, x, y))
+        features = [f for layer in layers.values() for f in layer["features"]]
+        assert sum(f["properties"]["count"] for f in features) == int(inside.sum()) > 0
+        if expected_points is not None:
+            assert len(features) == expected_points
+
+
+def test_prune_tile_cache_only_removes_other_versions(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_tiles, "TILE_CACHE_DIR", str(tmp_path))
+    monkeypatch.setattr(vector_tiles, "_pruned_version", None)
+    for name in [vector_tiles.version_key("old"), vector_tiles.version_key("new"), "README", "static"]:
+        (tmp_path / name).mkdir()
+    vector_tiles.prune_tile_cache("new")
+    assert sorted(p.name for p in tmp_path.iterdir()) == sorted([vector_tiles.version_key("new"), "README", "static"])
@@ -0,0 +1,171 @@
+import hashlib
+import math
+import os
+import re
+import shutil
+import threading
+
+import numpy as np
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response
+
+import accident_cache
+from async_data_layer import run_limited
+from data_source import YEARS
+from metrics import timed
+
+# mounted under /tiles by main.py
+router = APIRouter()
+
+TILE_EXTENT = 4096
+# points within this many tile units outside the tile are included, so circles on the edge are not cut off
+TILE_BUFFER = 64
+# below this zoom the points are merged per cell of THIN_CELL tile units (about the size of a drawn circle),
+# the merged point has the most frequent class of the cell and carries the number of accidents as count
+FULL_DETAIL_ZOOM = int(os.getenv("TILE_FULL_DETAIL_ZOOM", "13"))
+THIN_CELL = 64
+MAX_ZOOM = 18
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", "data/tile-cache")
+TILE_MAX_AGE = int(os.getenv("TILE_MAX_AGE", "86400"))
+CONTENT_TYPE = "application/vnd.mapbox-vector-tile"
+CLASS_COLUMNS = ["AccidentType_de", "AccidentSeverityCategory_de"]
+
+# version directory this process last pruned the tile cache for
+_pruned_version = None
+_prune_lock = threading.Lock()
+
+
+def project(lon, lat, z, x, y) -> tuple:
+    # web mercator position in units of the tile (z, x, y), y pointing down
+    n = 2 ** z
+    sin_lat = np.sin(np.radians(lat))
+    world_x = (lon + 180.0) / 360.0 * n
+    world_y = (0.5 - np.log((1 + sin_lat) / (1 - sin_lat)) / (4 * math.pi)) * n
+    return (world_x - x) * TILE_EXTENT, (world_y - y) * TILE_EXTENT
+
+
+def tile_bounds(z, x, y, buffer=0) -> tuple:
+    # (west, south, east, north) in degrees, widened by buffer tile units
+    n = 2 ** z
+    left, right = (x - buffer / TILE_EXTENT) / n, (x + 1 + buffer / TILE_EXTENT) / n
+    top, bottom = (y - buffer / TILE_EXTENT) / n, (y + 1 + buffer / TILE_EXTENT) / n
+    lat = [math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * v)))) for v in (bottom, top)]
+    return left * 360 - 180, lat[0], right * 360 - 180, lat[1]
+
+
+def thin_points(codes, tile_x, tile_y, n_categories) -> tuple:
+    # one point per cell: the first point of the most frequent class, counting all accidents of the cell
+    # the clipped coordinates run from -TILE_BUFFER to TILE_EXTENT + TILE_BUFFER inclusive
+    cells = (TILE_EXTENT + TILE_BUFFER) // THIN_CELL + 2
+    cell = (tile_x // THIN_CELL + 1) * cells + (tile_y // THIN_CELL + 1)
+    keys, first, class_counts = np.unique(cell * (n_categories + 1) + codes + 1, return_index=True,
+                                          return_counts=True)
+    key_cells = keys // (n_categories + 1)
+    # keys are sorted by cell, within a cell the largest class count comes first
+    order = np.lexsort((-class_counts, key_cells))
+    starts = np.r_[True, key_cells[order][1:] != key_cells[order][:-1]].nonzero()[0]
+    chosen = first[order[starts]]
+    return codes[chosen], tile_x[chosen], tile_y[chosen], np.add.reduceat(class_counts[order], starts)
+
+
+def build_tile(df, class_type, z, x, y) -> bytes:
+    # one layer per class label, the map page styles each of them with the colour of its class
+    import mapbox_vector_tile
+    import shapely
+
+    # cheap comparisons on the stored coordinates first, only the points of the tile are projected
+    west, south, east, north = tile_bounds(z, x, y, TILE_BUFFER)
+    lon = df['lon'].to_numpy()
+    lat = df['lat'].to_numpy()
+    inside = ((lon >= west) & (lon <= east) & (lat >= south) & (lat <= north)).nonzero()[0]
+    tile_x, tile_y = project(lon[inside].astype(np.float64), lat[inside].astype(np.float64), z, x, y)
+    classes = df[class_type]
+    codes = classes.cat.codes.to_numpy()[inside]
+    tile_x = np.clip(np.floor(tile_x), -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER).astype(np.int64)
+    tile_y = np.clip(np.floor(tile_y), -TILE_BUFFER, TILE_EXTENT + TILE_BUFFER).astype(np.int64)
+
+    counts = np.ones(len(inside), dtype=np.int64)
+    if z < FULL_DETAIL_ZOOM and len(inside):
+        codes, tile_x, tile_y, counts = thin_points(codes, tile_x, tile_y, len(classes.cat.categories))
+
+    layers = []
+    for code, label in enumerate(classes.cat.categories):
+        selected = (codes == code).nonzero()[0]
+        if len(selected) == 0:
+            continue
+        points = shapely.points(tile_x[selected], tile_y[selected])
+        layers.append({"name": str(label), "features": [
+            {"geometry": point, "properties": {"count": int(count)}}
+            for point, count in zip(points, counts[selected])]})
+    return mapbox_vector_tile.encode(layers, default_options={"extents": TILE_EXTENT, "y_coord_down": True})
+
+
+VERSION_KEY = re.compile(r"[0-9a-f]{12}")
+
+
+def version_key(version) -> str:
+    return hashlib.sha1(str(version).encode()).hexdigest()[:12]
+
+
+def tile_path(version, class_type, year, z, x, y) -> str:
+    # the data version is part of the path, tiles of older data are never served again
+    return os.path.join(TILE_CACHE_DIR, version_key(version), class_type, str(year), str(z), str(x), f"{y}.pbf")
+
+
+def prune_tile_cache(version):
+    # drops the tile trees of all other data versions once per version change, like the animation figure cache
+    global _pruned_version
+    key = version_key(version)
+    with _prune_lock:
+        if key == _pruned_version:
+            return
+        _pruned_version = key
+        if not os.path.isdir(TILE_CACHE_DIR):
+            return
+        for name in os.listdir(TILE_CACHE_DIR):
+            # anything else in the directory was not written by the tile cache and is left alone
+            if name != key and VERSION_KEY.fullmatch(name):
+                shutil.rmtree(os.path.join(TILE_CACHE_DIR, name), ignore_errors=True)
+                print(f"Removed tiles of data version {name}")
+
+
+def get_tile(year, class_type, z, x, y) -> bytes:
+    version = accident_cache.cache.current_version()
+    prune_tile_cache(version)
+    path = tile_path(version, class_type, year, z, x, y)
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            return file.read()
+
+    with timed("tiles", "data", year, class_type):
+        df = accident_cache.cache.get_frame(year)
+    with timed("tiles", f"tile_z{z}", year, class_type):
+        tile = build_tile(df, class_type, z, x, y)
+    # written next to the target and renamed, concurrent readers never see a partial tile
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as file:
+            file.write(tile)
+        os.replace(tmp_path, path)
+    except OSError as e:
+        # e.g. another worker pruned this version meanwhile, the tile is still served
+        print(f"Could not cache tile {path}! Exception: {e}")
+    return tile
+
+
+@router.get("/{year}/{z}/{x}/{y}.pbf")
+async def tile(request: Request, year: str, z: int, x: int, y: int, cls: str = "AccidentType_de"):
+    if year != "all" and year not in YEARS:
+        raise HTTPException(status_code=404, detail=f"No accidents for year {year}")
+    if cls not in CLASS_COLUMNS:
+        raise HTTPException(status_code=404, detail=f"Unknown class {cls}")
+    if not (0 <= z <= MAX_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=404, detail=f"No tile {z}/{x}/{y}")
+
+    data = await run_limited("tiles", get_tile, year, cls, z, x, y)
+    etag = f'"{hashlib.sha1(data).hexdigest()}"'
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={TILE_MAX_AGE}"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=data, media_type=CONTENT_TYPE, headers=headers)